@@ -1,16 +1,70 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
+import glob
+import gzip
+import hashlib
+import heapq
 import html
+import io
 import json
+import os
+import pickle
 import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
-from urllib.parse import urljoin
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+from urllib.parse import parse_qs, unquote, urljoin, urlparse
+
+from scripts.css_tools import (
+    DocumentTokenCollector,
+    filter_rules,
+    parse_css,
+    rebase_css_urls,
+    serialize_rules,
+)
+from scripts.http_pool import FetchError, pool_from_environment
+from scripts.image_probe import ImageDimensionIndex
 
 INPUT_PATH = Path("layout.builder (1).json")
 OUTPUT_PATH = Path("index.from-json.html")
+BATCH_OUTPUT_DIR = Path("build/pages")
 LIVE_SITE_URL = "https://englishplumber.nl/"
+LOCAL_MIRROR_HTML = Path("src/mirror/live-index.html")
+ASSET_MANIFEST_PATH = Path("src/generated/asset-manifest.json")
+MEDIA_MANIFEST_PATH = Path("src/generated/media-manifest.json")
+PUBLIC_DIR = Path("public")
+BODY_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+BUILD_CACHE_DIR = Path(".build-cache")
+FRAGMENT_CACHE_DIR = BUILD_CACHE_DIR / "fragments"
+FRAGMENT_CACHE_VERSION = 5
+FRAGMENT_CACHE_MAX_NODES = 32
+FRAGMENT_CACHE_NODE_FIELDS = ("tagName", "id", "linkUrl", "properties", "responsiveStyles", "component")
+FRAGMENT_SLOT = "\x00"
+LAYOUT_CACHE_DIR = BUILD_CACHE_DIR / "layouts"
+LAYOUT_CACHE_VERSION = 1
+METADATA_CACHE_PATH = BUILD_CACHE_DIR / "live-metadata.json"
+METADATA_CACHE_TTL_SECONDS = 24 * 60 * 60
+METADATA_TIMEOUT_SECONDS = 15.0
+PROFILE_REPORT_PATH = Path("build/profile.json")
+PROFILE_TOP_N = 10
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+CRITICAL_ELEMENT_LIMIT = 300
+CRITICAL_SCAN_CHUNK_SIZE = 64 * 1024
+WATCH_POLL_SECONDS = 0.2
+WATCH_SETTLE_SECONDS = 0.05
+IMAGE_INDEX_PATH = BUILD_CACHE_DIR / "image-dimensions.json"
+EAGER_IMAGE_COUNT = 2
+SRCSET_IMAGE_TYPE = "image/webp"
+BREAKPOINT_CSS_DIR = PUBLIC_DIR / "assets" / "styles" / "breakpoints"
+BREAKPOINT_LINKS_PATH = BUILD_CACHE_DIR / "breakpoint-links.json"
+MEDIA_CSS_INLINE_THRESHOLD = 4 * 1024
 
 VOID_TAGS = {
     "area",
@@ -29,6 +83,9 @@ VOID_TAGS = {
     "wbr",
 }
 
+KEBAB_CACHE_SIZE = 4096
+STYLE_CSS_CACHE_SIZE = 16384
+
 BREAKPOINT_QUERIES = {
     "medium": "(max-width: 991px)",
     "small": "(max-width: 640px)",
@@ -36,6 +93,11 @@ BREAKPOINT_QUERIES = {
 }
 
 TAG_STRIPPER = re.compile(r"<[^>]*>")
+TAG_PATTERN = re.compile(r"(<[^>]*>)")
+RAW_TEXT_BLOCK_PATTERN = re.compile(r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL)
+# HTML whitespace only: \s would also swallow significant characters like U+00A0.
+HTML_WHITESPACE_RUN_PATTERN = re.compile(r"[ \t\n\r\f]{2,}")
+UNQUOTED_ATTR_VALUE_PATTERN = re.compile(r"[^ \t\n\r\f\"'=<>`]+")
 HTML_CLASS_PATTERN = re.compile(r"<html[^>]*\sclass=\"([^\"]+)\"", re.IGNORECASE)
 BODY_CLASS_PATTERN = re.compile(r"<body[^>]*\sclass=\"([^\"]+)\"", re.IGNORECASE)
 STYLESHEET_PATTERN = re.compile(
@@ -53,6 +115,34 @@ DROP_STYLE_KEYS = {
     "textEmphasisColor",
 }
 
+ROOT_STYLE_TAGS = {"html", "head", "title"}
+
+# Tree optimization (--optimize-tree).
+OPTIMIZE_PROTECTED_TAGS = {"html", "head", "title", "body"}
+EMPTY_DROPPABLE_TAGS = {"div", "span"}
+MERGEABLE_TEXT_TAGS = {"span", "strong", "em", "b", "i", "small"}
+GAP_STYLE_KEYS = {"gap", "rowGap", "columnGap", "gridGap", "gridRowGap", "gridColumnGap"}
+ID_REFERENCE_ATTRS = {
+    "aria-activedescendant",
+    "aria-controls",
+    "aria-describedby",
+    "aria-details",
+    "aria-labelledby",
+    "aria-owns",
+    "for",
+    "form",
+    "list",
+}
+FRAGMENT_ID_REFERENCE_PATTERN = re.compile(r"(?:href=[\"']#|url\(\s*[\"']?#)([^\"')\s]+)")
+
+DEFAULT_ATTR_VALUES = {
+    ("script", "type"): "text/javascript",
+    ("style", "type"): "text/css",
+    ("link", "type"): "text/css",
+    ("form", "method"): "get",
+    ("input", "type"): "text",
+}
+
 DROP_FONT_FAMILIES = {
     '"Times New Roman"',
     "Arial, Helvetica, sans-serif",
@@ -67,8 +157,15 @@ FALLBACK_STYLESHEET_URLS = [
     "https://englishplumber.nl/_next/static/css/d61da687db648e05.css?dpl=dpl_Dr9PCzXjGVYsy4rPKKwmrBjrTwpK",
     "https://englishplumber.nl/critical-mobile.css",
 ]
+FONT_MIME_TYPES = {
+    ".woff2": "font/woff2",
+    ".woff": "font/woff",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+}
 
 
+@lru_cache(maxsize=KEBAB_CACHE_SIZE)
 def camel_to_kebab(name: str) -> str:
     if "-" in name:
         return name
@@ -94,7 +191,76 @@ def style_dict_to_css(style: Dict[str, str]) -> str:
     return ";".join(parts) + ";"
 
 
-def render_attrs(attrs: Dict[str, str]) -> str:
+def filter_styles(tag_name: str, style: Dict[str, str]) -> Dict[str, str]:
+    filtered: Dict[str, str] = {}
+    for key, value in style.items():
+        if key in DROP_STYLE_KEYS:
+            continue
+        if key == "fontFamily" and value in DROP_FONT_FAMILIES:
+            continue
+        if tag_name in ROOT_STYLE_TAGS:
+            # Root/head/title visual styles are export artifacts.
+            continue
+        filtered[key] = value
+    return filtered
+
+
+@lru_cache(maxsize=STYLE_CSS_CACHE_SIZE)
+def compile_style_items(is_root_tag: bool, items: Tuple[Tuple[str, Any], ...]) -> Tuple[int, str]:
+    if is_root_tag:
+        return 0, ""
+    filtered = filter_styles("", dict(items))
+    return len(filtered), style_dict_to_css(filtered)
+
+
+def compile_styles(tag_name: str, style: Dict[str, Any]) -> Tuple[int, str]:
+    # Returns (declaration count after filtering, CSS text). Filtering only
+    # depends on whether the tag is a root tag, so that is all the key keeps.
+    if not style:
+        return 0, ""
+    try:
+        return compile_style_items(tag_name in ROOT_STYLE_TAGS, tuple(style.items()))
+    except TypeError:
+        # Unhashable values (nested lists/dicts) skip the cache.
+        filtered = filter_styles(tag_name, style)
+        return len(filtered), style_dict_to_css(filtered)
+
+
+def style_cache_stats() -> Dict[str, Dict[str, Any]]:
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name, cached in (("kebab", camel_to_kebab), ("css", compile_style_items)):
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+    return stats
+
+
+def to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    if value == 0:
+        return "0"
+    chars: List[str] = []
+    while value:
+        value, remainder = divmod(value, 36)
+        chars.append(digits[remainder])
+    return "".join(reversed(chars))
+
+
+def group_rules(rules: Dict[str, List[str]]) -> str:
+    # Rules with identical declarations share one block with a selector list.
+    return "".join(
+        f"{','.join('.' + name for name in class_names)}{{{css}}}"
+        for css, class_names in rules.items()
+    )
+
+
+def render_attrs(attrs: Dict[str, str], minify: bool = False) -> str:
     chunks: List[str] = []
     for key, value in attrs.items():
         escaped_key = html.escape(str(key), quote=True)
@@ -104,10 +270,216 @@ def render_attrs(attrs: Dict[str, str]) -> str:
             chunks.append(f" {escaped_key}")
             continue
         escaped_value = html.escape(str(value), quote=True)
+        if minify and UNQUOTED_ATTR_VALUE_PATTERN.fullmatch(escaped_value):
+            chunks.append(f" {escaped_key}={escaped_value}")
+            continue
         chunks.append(f' {escaped_key}="{escaped_value}"')
     return "".join(chunks)
 
 
+def drop_default_attrs(tag_name: str, attrs: Dict[str, str]) -> None:
+    for key in [key for key in attrs if (tag_name, key) in DEFAULT_ATTR_VALUES]:
+        if str(attrs[key]).strip().lower() == DEFAULT_ATTR_VALUES[(tag_name, key)]:
+            del attrs[key]
+
+
+def minify_html_fragment(fragment: str) -> str:
+    # Collapses whitespace runs in text and between tags only; tags themselves
+    # and pre/textarea/script/style blocks are copied through untouched.
+    chunks: List[str] = []
+    for index, block in enumerate(RAW_TEXT_BLOCK_PATTERN.split(fragment)):
+        if index % 3 == 2:
+            continue  # tag-name group captured by the split
+        if index % 3 == 1:
+            chunks.append(block)
+            continue
+        for piece in TAG_PATTERN.split(block):
+            if piece.startswith("<"):
+                chunks.append(piece)
+            else:
+                chunks.append(HTML_WHITESPACE_RUN_PATTERN.sub(" ", piece))
+    return "".join(chunks)
+
+
+def preserves_whitespace(node: Dict[str, Any]) -> bool:
+    if resolve_tag_name(node) in {"pre", "textarea"}:
+        return True
+    for bp_styles in (node.get("responsiveStyles") or {}).values():
+        white_space = str((bp_styles or {}).get("whiteSpace", ""))
+        if white_space.startswith("pre") or white_space == "break-spaces":
+            return True
+    class_names = str((node.get("properties") or {}).get("class", ""))
+    return "whitespace-pre" in class_names or "whitespace-break-spaces" in class_names
+
+
+def local_stylesheet_path(stylesheet_url: str) -> Optional[Path]:
+    parsed = urlparse(stylesheet_url)
+    if parsed.scheme or parsed.netloc or not parsed.path.startswith("/"):
+        return None
+    candidate = PUBLIC_DIR / unquote(parsed.path.lstrip("/"))
+    return candidate if candidate.is_file() else None
+
+
+@lru_cache(maxsize=32)
+def load_stylesheet_rules(path: str, mtime_ns: int) -> List[Dict[str, Any]]:
+    # Keyed by mtime so a watch/batch process never serves a stale parse.
+    return parse_css(Path(path).read_text(encoding="utf-8", errors="replace"))
+
+
+@lru_cache(maxsize=4)
+def load_media_manifest(path: str, mtime_ns: int) -> Dict[str, Any]:
+    try:
+        manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def media_manifest() -> Dict[str, Any]:
+    try:
+        mtime_ns = MEDIA_MANIFEST_PATH.stat().st_mtime_ns
+    except OSError:
+        return {}
+    return load_media_manifest(str(MEDIA_MANIFEST_PATH), mtime_ns)
+
+
+def media_manifest_fingerprint() -> str:
+    try:
+        stat = MEDIA_MANIFEST_PATH.stat()
+    except OSError:
+        return "none"
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def local_image_path(image_url: str) -> Optional[Path]:
+    # Maps a layout image URL to the file mirrored under public/: Next.js
+    # /_next/image proxies are unwrapped, CMS media goes through the media
+    # manifest and other same-origin paths are looked up in public/ directly.
+    parsed = urlparse(image_url)
+    if parsed.netloc and parsed.netloc != urlparse(LIVE_SITE_URL).netloc:
+        return None
+
+    path = parsed.path
+    if path == "/_next/image":
+        source_values = parse_qs(parsed.query).get("url")
+        if not source_values:
+            return None
+        path = urlparse(source_values[0]).path
+    if not path.startswith("/"):
+        return None
+
+    media_map = media_manifest().get("media") or {}
+    mirrored = media_map.get(path) or media_map.get(unquote(path))
+    if mirrored:
+        path = mirrored
+
+    candidate = PUBLIC_DIR / unquote(path.lstrip("/"))
+    return candidate if candidate.is_file() else None
+
+
+def image_srcset(local_path: Path) -> Optional[str]:
+    # WebP variants recorded by sync_media_assets for a mirrored image, plus
+    # the original when no variant covers its full width. A plain <img> can
+    # only offer one type, and WebP is the one every current browser decodes.
+    entry = (media_manifest().get("images") or {}).get(f"/{local_path.relative_to(PUBLIC_DIR).as_posix()}")
+    if not entry:
+        return None
+    variants = [variant for variant in entry.get("variants", []) if variant.get("type") == SRCSET_IMAGE_TYPE]
+    if not variants:
+        return None
+    candidates = [f"{variant['url']} {variant['width']}w" for variant in variants]
+    if max(variant["width"] for variant in variants) < entry["width"]:
+        candidates.append(f"/{local_path.relative_to(PUBLIC_DIR).as_posix()} {entry['width']}w")
+    return ", ".join(candidates)
+
+
+def write_breakpoint_stylesheet(bp: str, css: str) -> str:
+    # Content-hashed, so an existing file already holds these exact rules and
+    # the URL can be cached as immutable (public/_headers covers /assets/*).
+    digest = hashlib.sha1(css.encode("utf-8")).hexdigest()[:10]
+    path = BREAKPOINT_CSS_DIR / f"{bp}.{digest}.css"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(css, encoding="utf-8")
+        tmp_path.replace(path)
+    return f"/{path.relative_to(PUBLIC_DIR).as_posix()}"
+
+
+def prune_breakpoint_stylesheets(results: List[Dict[str, Any]]) -> int:
+    # Records which breakpoint stylesheets each built page links and removes
+    # the ones that only rebuilt pages used to link. Files never recorded
+    # here, or still linked by another page, are left alone. Returns the
+    # number removed.
+    try:
+        links = json.loads(BREAKPOINT_LINKS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        links = {}
+    previous: Set[str] = set()
+    for result in results:
+        page = Path(result["output"]).resolve().as_posix()
+        previous.update(links.get(page, []))
+        links[page] = sorted(stats["href"] for stats in result["breakpoint_css"].values() if stats["href"])
+    still_linked = {href for hrefs in links.values() for href in hrefs}
+    removed = 0
+    for href in previous - still_linked:
+        path = PUBLIC_DIR / href.lstrip("/")
+        if path.exists():
+            path.unlink()
+            removed += 1
+
+    BREAKPOINT_LINKS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = BREAKPOINT_LINKS_PATH.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(links, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    tmp_path.replace(BREAKPOINT_LINKS_PATH)
+    return removed
+
+
+def write_precompressed(path: Path) -> Dict[str, int]:
+    # Writes .gz (and .br / .zst when those modules are installed) next to
+    # `path` at maximum compression, removing stale siblings it cannot refresh.
+    sizes: Dict[str, int] = {}
+
+    gzip_path = path.with_name(f"{path.name}.gz")
+    with path.open("rb") as source, gzip_path.open("wb") as raw_target:
+        with gzip.GzipFile(filename="", mode="wb", fileobj=raw_target, compresslevel=9, mtime=0) as target:
+            shutil.copyfileobj(source, target)
+    sizes["gzip"] = gzip_path.stat().st_size
+
+    brotli_path = path.with_name(f"{path.name}.br")
+    try:
+        import brotli  # type: ignore
+    except ImportError:
+        brotli_path.unlink(missing_ok=True)
+    else:
+        compressor = brotli.Compressor(quality=11)
+        with path.open("rb") as source, brotli_path.open("wb") as target:
+            for chunk in iter(lambda: source.read(COMPRESS_CHUNK_SIZE), b""):
+                target.write(compressor.process(chunk))
+            target.write(compressor.finish())
+        sizes["br"] = brotli_path.stat().st_size
+
+    zstd_path = path.with_name(f"{path.name}.zst")
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        zstd_path.unlink(missing_ok=True)
+    else:
+        with path.open("rb") as source, zstd_path.open("wb") as raw_target:
+            with zstandard.ZstdCompressor(level=22).stream_writer(raw_target) as target:
+                shutil.copyfileobj(source, target)
+        sizes["zstd"] = zstd_path.stat().st_size
+
+    return sizes
+
+
+def remove_precompressed(path: Path) -> None:
+    # A page rebuilt without --precompress must not keep serving the
+    # compressed copies of an older build next to it.
+    for suffix in (".gz", ".br", ".zst"):
+        path.with_name(f"{path.name}{suffix}").unlink(missing_ok=True)
+
+
 def strip_tags(value: str) -> str:
     return TAG_STRIPPER.sub("", value)
 
@@ -123,22 +495,18 @@ def uniq_keep_order(items: List[str]) -> List[str]:
     return out
 
 
-def fetch_live_site_metadata() -> Dict[str, Any]:
-    metadata: Dict[str, Any] = {
+def fallback_site_metadata() -> Dict[str, Any]:
+    return {
         "html_class": FALLBACK_HTML_CLASS,
         "body_class": FALLBACK_BODY_CLASS,
         "stylesheet_urls": FALLBACK_STYLESHEET_URLS.copy(),
+        "source": "fallback",
     }
 
-    source_html = ""
-    try:
-        import requests  # type: ignore
 
-        response = requests.get(LIVE_SITE_URL, timeout=15)
-        response.raise_for_status()
-        source_html = response.text
-    except Exception:
-        return metadata
+def parse_site_metadata(source_html: str, source: str) -> Dict[str, Any]:
+    metadata = fallback_site_metadata()
+    metadata["source"] = source
 
     html_class_match = HTML_CLASS_PATTERN.search(source_html)
     body_class_match = BODY_CLASS_PATTERN.search(source_html)
@@ -150,242 +518,1766 @@ def fetch_live_site_metadata() -> Dict[str, Any]:
 
     stylesheet_hrefs = STYLESHEET_PATTERN.findall(source_html)
     stylesheet_urls = [urljoin(LIVE_SITE_URL, href) for href in stylesheet_hrefs]
-    metadata["stylesheet_urls"] = uniq_keep_order(stylesheet_urls)
+    if stylesheet_urls:
+        metadata["stylesheet_urls"] = uniq_keep_order(stylesheet_urls)
+
+    return metadata
+
+
+def fetch_live_site_metadata() -> Optional[Dict[str, Any]]:
+    # Goes through the shared HTTP cache, and the record/replay archive when
+    # HTTP_ARCHIVE_MODE is set, like the sync scripts.
+    try:
+        with pool_from_environment(retries=1, timeout=METADATA_TIMEOUT_SECONDS) as pool:
+            text = pool.fetch_text(LIVE_SITE_URL)
+    except (FetchError, OSError):
+        return None
+    return parse_site_metadata(text, "live")
+
 
-    if not metadata["stylesheet_urls"]:
-        metadata["stylesheet_urls"] = FALLBACK_STYLESHEET_URLS.copy()
+def load_local_site_metadata() -> Optional[Dict[str, Any]]:
+    if not LOCAL_MIRROR_HTML.exists():
+        return None
 
+    metadata = parse_site_metadata(
+        LOCAL_MIRROR_HTML.read_text(encoding="utf-8", errors="ignore"),
+        "local",
+    )
+    try:
+        manifest = json.loads(ASSET_MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return metadata
+
+    # Prefer the localized copies written by scripts/sync_assets.py.
+    local_stylesheets = [f"/{path.lstrip('/')}" for path in manifest.get("stylesheets") or []]
+    if local_stylesheets:
+        metadata["stylesheet_urls"] = local_stylesheets
+    font_preloads = [f"/{path.lstrip('/')}" for path in manifest.get("preload") or []]
+    if font_preloads:
+        metadata["font_preloads"] = font_preloads
     return metadata
 
 
-def collect_title_text(node: Dict[str, Any]) -> str:
-    out: List[str] = []
+def load_cached_site_metadata() -> Optional[Dict[str, Any]]:
+    try:
+        payload = json.loads(METADATA_CACHE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if time.time() - payload.get("fetched_at", 0) > METADATA_CACHE_TTL_SECONDS:
+        return None
+    metadata = payload.get("metadata")
+    if not isinstance(metadata, dict):
+        return None
+    return {**metadata, "source": "cache"}
+
+
+def save_cached_site_metadata(metadata: Dict[str, Any]) -> None:
+    METADATA_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    payload = {"fetched_at": time.time(), "metadata": metadata}
+    METADATA_CACHE_PATH.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+
+def resolve_live_site_metadata(refresh: bool = False) -> Dict[str, Any]:
+    # Offline-first: the network is only used when a refresh is requested.
+    if refresh:
+        live_metadata = fetch_live_site_metadata()
+        if live_metadata is not None:
+            save_cached_site_metadata(live_metadata)
+            return live_metadata
+
+    return load_local_site_metadata() or load_cached_site_metadata() or fallback_site_metadata()
+
+
+class ByteCounter:
+    # Write-only sink that measures UTF-8 output size without keeping it.
+    def __init__(self) -> None:
+        self.size = 0
+
+    def write(self, chunk: str) -> int:
+        self.size += len(chunk.encode("utf-8"))
+        return len(chunk)
+
+
+def resolve_tag_name(node: Dict[str, Any]) -> str:
+    tag_name = (node.get("tagName") or "").strip()
+    if not tag_name and (node.get("component") or {}).get("name") == "Raw:Img":
+        tag_name = "img"
+    if not tag_name:
+        tag_name = "div"
+    return tag_name.lower()
+
+
+def walk_tree(
+    root: Dict[str, Any],
+    enter: Callable[[Dict[str, Any]], bool],
+    leave: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> None:
+    # Pre-order walk with an explicit stack so deep layouts never hit the
+    # recursion limit. `enter` returns False to skip a node's children;
+    # `leave` runs after the children of every node that was descended into.
+    stack: List[Tuple[Dict[str, Any], bool]] = [(root, False)]
+    while stack:
+        node, leaving = stack.pop()
+        if leaving:
+            if leave is not None:
+                leave(node)
+            continue
+        if not enter(node):
+            continue
+        stack.append((node, True))
+        children = node.get("children") or []
+        for child in reversed(children):
+            if isinstance(child, dict):
+                stack.append((child, False))
+
+
+def count_nodes(root: Dict[str, Any]) -> int:
+    count = 0
+
+    def enter(_node: Dict[str, Any]) -> bool:
+        nonlocal count
+        count += 1
+        return True
+
+    walk_tree(root, enter)
+    return count
 
-    def walk(current: Dict[str, Any]) -> None:
-        component = current.get("component") or {}
-        if component.get("name") == "Text":
-            text_value = component.get("options", {}).get("text", "")
-            if text_value:
-                out.append(strip_tags(text_value))
-        for child in current.get("children") or []:
+
+def collect_referenced_ids(root: Dict[str, Any]) -> Set[str]:
+    # Ids other markup points at (aria relations, labels, in-page links); the
+    # nodes carrying them are never removed or collapsed.
+    referenced: Set[str] = set()
+
+    def enter(node: Dict[str, Any]) -> bool:
+        properties = node.get("properties") or {}
+        for key, value in properties.items():
+            if key in ID_REFERENCE_ATTRS:
+                referenced.update(str(value).split())
+            elif key in ("href", "xlink:href") and str(value).startswith("#"):
+                referenced.add(str(value)[1:])
+        link_url = str(node.get("linkUrl") or "")
+        if link_url.startswith("#"):
+            referenced.add(link_url[1:])
+        options = (node.get("component") or {}).get("options") or {}
+        for fragment in (options.get("text"), options.get("code")):
+            if isinstance(fragment, str):
+                referenced.update(FRAGMENT_ID_REFERENCE_PATTERN.findall(fragment))
+        return True
+
+    walk_tree(root, enter)
+    return referenced
+
+
+def has_rendered_styles(node: Dict[str, Any]) -> bool:
+    tag_name = resolve_tag_name(node)
+    return any(
+        compile_styles(tag_name, bp_styles or {})[0]
+        for bp_styles in (node.get("responsiveStyles") or {}).values()
+    )
+
+
+def is_bare_node(node: Dict[str, Any], referenced_ids: Set[str]) -> bool:
+    # Renders as nothing but a tag (plus the export's own builder id).
+    if node.get("properties") or node.get("linkUrl") or has_rendered_styles(node):
+        return False
+    return node.get("id") not in referenced_ids
+
+
+def is_hidden_everywhere(node: Dict[str, Any]) -> bool:
+    styles = node.get("responsiveStyles") or {}
+    large_display = str((styles.get("large") or {}).get("display", "")).split()
+    if large_display[:1] != ["none"]:
+        return False
+    for bp in BREAKPOINT_QUERIES:
+        bp_display = str((styles.get(bp) or {}).get("display", "none")).split()
+        if bp_display[:1] != ["none"]:
+            return False
+    return True
+
+
+def has_box_edges(node: Dict[str, Any]) -> bool:
+    for bp_styles in (node.get("responsiveStyles") or {}).values():
+        for key, value in (bp_styles or {}).items():
+            if key.startswith(("padding", "margin")) or (key.startswith("border") and key.endswith("Width")):
+                if str(value).strip() not in ("", "0", "0px"):
+                    return True
+    return False
+
+
+def arranges_children(node: Dict[str, Any]) -> bool:
+    # Flex/grid containers space and place each child, and classed elements
+    # can be targeted by `>` or :nth-child rules in the localized CSS, so the
+    # number and nesting of their children is part of how they render.
+    properties = node.get("properties") or {}
+    if properties.get("class") or properties.get("className"):
+        return True
+    for bp_styles in (node.get("responsiveStyles") or {}).values():
+        for key, value in (bp_styles or {}).items():
+            if key == "display" and ("flex" in str(value) or "grid" in str(value)):
+                return True
+            if key in GAP_STYLE_KEYS and str(value).strip() not in ("", "0", "0px", "normal"):
+                return True
+    return False
+
+
+def can_merge_text(left: Dict[str, Any], right: Dict[str, Any], referenced_ids: Set[str]) -> bool:
+    # Adjacent inline Text siblings with identical styles render the same as
+    # one element, as long as neither has padding/margin/border at the seam.
+    for node in (left, right):
+        if (node.get("component") or {}).get("name") != "Text":
+            return False
+        if node.get("properties") or node.get("linkUrl") or node.get("children"):
+            return False
+        if node.get("id") in referenced_ids or resolve_tag_name(node) not in MERGEABLE_TEXT_TAGS:
+            return False
+    return (
+        resolve_tag_name(left) == resolve_tag_name(right)
+        and left.get("responsiveStyles") == right.get("responsiveStyles")
+        and not has_box_edges(left)
+    )
+
+
+def merge_text_nodes(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    left_options = left["component"].get("options") or {}
+    right_options = right["component"].get("options") or {}
+    text = f"{left_options.get('text') or ''}{right_options.get('text') or ''}"
+    return {**left, "component": {**left["component"], "options": {**left_options, "text": text}}}
+
+
+def optimize_tree(root: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    # Returns a smaller copy of the layout tree (the input is not modified):
+    # subtrees hidden with display:none at every breakpoint are dropped, then
+    # bare empty div/span elements, bare div wrappers around a single div are
+    # replaced by that div, and adjacent identical inline Text nodes merged.
+    # Children are processed first, so removals cascade up the tree. Bare
+    # elements are kept when their parent arranges its children.
+    referenced_ids = collect_referenced_ids(root)
+    stats = {
+        "nodes_before": count_nodes(root),
+        "hidden_subtrees": 0,
+        "hidden_nodes": 0,
+        "empty_elements": 0,
+        "wrappers": 0,
+        "merged_text": 0,
+    }
+    optimized: Dict[int, Optional[Dict[str, Any]]] = {}
+    # (node, children processed, parent arranges its children)
+    stack: List[Tuple[Dict[str, Any], bool, bool]] = [(root, False, False)]
+    while stack:
+        node, children_done, in_arranged_parent = stack.pop()
+        children = [child for child in node.get("children") or [] if isinstance(child, dict)]
+        protected = node is root or resolve_tag_name(node) in OPTIMIZE_PROTECTED_TAGS
+        if not children_done:
+            if not protected and is_hidden_everywhere(node) and node.get("id") not in referenced_ids:
+                optimized[id(node)] = None
+                stats["hidden_subtrees"] += 1
+                stats["hidden_nodes"] += count_nodes(node)
+                continue
+            stack.append((node, True, in_arranged_parent))
+            arranged = arranges_children(node)
+            stack.extend((child, False, arranged) for child in reversed(children))
+            continue
+
+        new_children: List[Dict[str, Any]] = []
+        for child in children:
+            replacement = optimized.pop(id(child))
+            if replacement is None:
+                continue
+            if new_children and can_merge_text(new_children[-1], replacement, referenced_ids):
+                new_children[-1] = merge_text_nodes(new_children[-1], replacement)
+                stats["merged_text"] += 1
+                continue
+            new_children.append(replacement)
+
+        unchanged = len(new_children) == len(children) and all(
+            new is old for new, old in zip(new_children, children)
+        )
+        result = node if unchanged else {**node, "children": new_children}
+        component_name = (node.get("component") or {}).get("name")
+        if not protected and not component_name and not in_arranged_parent and is_bare_node(node, referenced_ids):
+            tag_name = resolve_tag_name(node)
+            if not new_children and tag_name in EMPTY_DROPPABLE_TAGS:
+                result = None
+                stats["empty_elements"] += 1
+            elif tag_name == "div" and len(new_children) == 1 and resolve_tag_name(new_children[0]) == "div":
+                result = new_children[0]
+                stats["wrappers"] += 1
+        optimized[id(node)] = result
+
+    optimized_root = optimized[id(root)] or root
+    stats["nodes_after"] = count_nodes(optimized_root)
+    stats["nodes_removed"] = stats["nodes_before"] - stats["nodes_after"]
+    return optimized_root, stats
+
+
+class LayoutNode:
+    # Render-ready form of a Builder element: tag and component resolved,
+    # styles compiled to CSS text per breakpoint, only element children kept.
+    __slots__ = (
+        "tag_name",
+        "component_name",
+        "node_id",
+        "link_url",
+        "properties",
+        "styles",
+        "has_breakpoint_styles",
+        "content",
+        "image",
+        "preserve_whitespace",
+        "children",
+    )
+
+    def __init__(self, node: Dict[str, Any]) -> None:
+        component = node.get("component") or {}
+        options = component.get("options") or {}
+        self.tag_name = resolve_tag_name(node)
+        self.component_name = component.get("name") or ""
+        self.node_id = node.get("id") or None
+        self.link_url = node.get("linkUrl") or None
+        self.properties = node.get("properties") or None
+
+        # (large, *BREAKPOINT_QUERIES) CSS; filtering only needs the raw tag
+        # name to tell root tags apart.
+        styles = node.get("responsiveStyles") or {}
+        raw_tag_name = (node.get("tagName") or "").strip().lower()
+        compiled = [compile_styles(raw_tag_name, styles.get(bp) or {}) for bp in ("large", *BREAKPOINT_QUERIES)]
+        self.styles = tuple(css for _, css in compiled)
+        self.has_breakpoint_styles = any(count for count, _ in compiled[1:])
+
+        self.content = ""
+        if self.component_name == "Text":
+            self.content = options.get("text", "")
+        elif self.component_name == "Custom Code":
+            self.content = options.get("code", "")
+        self.image = options.get("image") if self.component_name == "Raw:Img" else None
+        self.preserve_whitespace = preserves_whitespace(node)
+        self.children: List[LayoutNode] = []
+
+    def fingerprint(self) -> str:
+        # Everything that affects this node's own markup, for subtree hashing.
+        return json.dumps(
+            [
+                self.tag_name,
+                self.component_name,
+                self.node_id,
+                self.link_url,
+                self.properties,
+                self.styles,
+                self.has_breakpoint_styles,
+                self.content,
+                self.image,
+                self.preserve_whitespace,
+            ],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+
+
+LAYOUT_NODE_FIELDS = LayoutNode.__slots__[:-1]
+# Cached rows are matched to LAYOUT_NODE_FIELDS by position, so the field
+# list is part of the cache key: changing the slots can never load old rows.
+LAYOUT_CACHE_SCHEMA = hashlib.sha1(
+    f"{LAYOUT_CACHE_VERSION}:{','.join(LAYOUT_NODE_FIELDS)}".encode("utf-8")
+).hexdigest()[:10]
+
+
+def compact_tree(root: Dict[str, Any]) -> LayoutNode:
+    compact_root = LayoutNode(root)
+    stack: List[Tuple[Dict[str, Any], LayoutNode]] = [(root, compact_root)]
+    while stack:
+        node, compact_node = stack.pop()
+        for child in node.get("children") or []:
             if isinstance(child, dict):
-                walk(child)
+                compact_child = LayoutNode(child)
+                compact_node.children.append(compact_child)
+                stack.append((child, compact_child))
+    return compact_root
+
+
+def walk_layout(
+    root: LayoutNode,
+    enter: Callable[[LayoutNode], bool],
+    leave: Optional[Callable[[LayoutNode], None]] = None,
+) -> None:
+    # walk_tree for LayoutNode trees.
+    stack: List[Tuple[LayoutNode, bool]] = [(root, False)]
+    while stack:
+        node, leaving = stack.pop()
+        if leaving:
+            if leave is not None:
+                leave(node)
+            continue
+        if not enter(node):
+            continue
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.children))
+
+
+def compute_subtree_info(root: LayoutNode, salt: str) -> Dict[int, Tuple[str, int, int]]:
+    # Post-order pass: each subtree hash covers the node's rendered fields plus
+    # its children's hashes, so any edit changes the hash of every ancestor.
+    # Values are (hash, node count, Raw:Img count).
+    info: Dict[int, Tuple[str, int, int]] = {}
+    stack: List[Tuple[LayoutNode, bool]] = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+            continue
+
+        digest = hashlib.sha1(salt.encode("utf-8"))
+        digest.update(node.fingerprint().encode("utf-8"))
+        size = 1
+        images = 1 if node.component_name == "Raw:Img" else 0
+        for child in node.children:
+            child_hash, child_size, child_images = info[id(child)]
+            digest.update(child_hash.encode("ascii"))
+            size += child_size
+            images += child_images
+        info[id(node)] = (digest.hexdigest(), size, images)
+    return info
+
+
+def flatten_layout(root: LayoutNode) -> List[Tuple[Any, ...]]:
+    # Pre-order rows of (*LAYOUT_NODE_FIELDS, child count). Pickling rows
+    # instead of the linked nodes keeps deep layouts clear of pickle's
+    # recursion limit.
+    rows: List[Tuple[Any, ...]] = []
+
+    def enter(node: LayoutNode) -> bool:
+        rows.append((*(getattr(node, field) for field in LAYOUT_NODE_FIELDS), len(node.children)))
+        return True
+
+    walk_layout(root, enter)
+    return rows
+
+
+def inflate_layout(rows: List[Tuple[Any, ...]]) -> LayoutNode:
+    root: Optional[LayoutNode] = None
+    # [node, children still to attach], innermost open parent last.
+    open_parents: List[List[Any]] = []
+    row_length = len(LAYOUT_NODE_FIELDS) + 1
+    for row in rows:
+        if len(row) != row_length:
+            raise ValueError(f"Layout cache row has {len(row)} columns, expected {row_length}")
+        node = LayoutNode.__new__(LayoutNode)
+        for field, value in zip(LAYOUT_NODE_FIELDS, row):
+            setattr(node, field, value)
+        node.children = []
+        if open_parents:
+            open_parents[-1][0].children.append(node)
+            open_parents[-1][1] -= 1
+        else:
+            root = node
+        if row[-1]:
+            open_parents.append([node, row[-1]])
+        while open_parents and open_parents[-1][1] == 0:
+            open_parents.pop()
+    if root is None:
+        raise ValueError("Empty layout cache")
+    return root
+
+
+def collect_title_text(node: LayoutNode) -> str:
+    out: List[str] = []
+
+    def enter(current: LayoutNode) -> bool:
+        if current.component_name == "Text" and current.content:
+            out.append(strip_tags(current.content))
+        return True
 
-    walk(node)
+    walk_layout(node, enter)
     title = "".join(out).strip()
     return title or "Builder Page"
 
 
+class FragmentCache:
+    # On-disk store of rendered subtree fragments keyed by subtree hash. Only
+    # entries used by the latest build are written back, so it never grows stale.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries = self.load()
+        self.used: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if payload.get("version") != FRAGMENT_CACHE_VERSION:
+            return {}
+        return payload.get("entries") or {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used[key] = entry
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self.used[key] = entry
+
+    def next_build(self) -> None:
+        # Keeps the cache resident across --watch rebuilds: the fragments the
+        # last build used become the lookup set for the next one.
+        self.entries = self.used
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": FRAGMENT_CACHE_VERSION, "entries": self.used}
+        tmp_path = self.path.with_suffix(f"{self.path.suffix}.tmp")
+        tmp_path.write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+        tmp_path.replace(self.path)
+
+
+class BuildProfiler:
+    # Collects per-phase timings, per-component counters and the heaviest
+    # subtrees for `--profile`. Bytes are counted as UTF-8 as chunks are written.
+    def __init__(self, top_n: int = PROFILE_TOP_N) -> None:
+        self.top_n = top_n
+        self.phases: Dict[str, float] = {}
+        self.components: Dict[str, Dict[str, float]] = {}
+        self.bytes_written = 0
+        self.nodes_seen = 0
+        self.inline_style_bytes = 0
+        self.heaviest: List[Tuple[int, int, Dict[str, Any]]] = []
+        self.open_subtrees: Dict[int, Tuple[int, int]] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def counting_writer(self, write: Callable[[str], Any]) -> Callable[[str], Any]:
+        def counted(chunk: str) -> Any:
+            self.bytes_written += len(chunk.encode("utf-8"))
+            return write(chunk)
+
+        return counted
+
+    def component_stats(self, node: LayoutNode) -> Dict[str, float]:
+        label = node.component_name or "box"
+        stats = self.components.get(label)
+        if stats is None:
+            stats = {"nodes": 0, "seconds": 0.0, "bytes": 0}
+            self.components[label] = stats
+        return stats
+
+    def record_subtree(self, node: LayoutNode, size: int, nodes: int) -> None:
+        entry = {
+            "id": node.node_id or "",
+            "tag": node.tag_name,
+            "component": node.component_name or "box",
+            "bytes": size,
+            "nodes": nodes,
+        }
+        item = (size, self.nodes_seen, entry)
+        if len(self.heaviest) < self.top_n:
+            heapq.heappush(self.heaviest, item)
+        elif size > self.heaviest[0][0]:
+            heapq.heapreplace(self.heaviest, item)
+
+    def instrument(
+        self,
+        enter: Callable[[LayoutNode], bool],
+        leave: Callable[[LayoutNode], None],
+    ) -> Tuple[Callable[[LayoutNode], bool], Callable[[LayoutNode], None]]:
+        def profiled_enter(node: LayoutNode) -> bool:
+            start_bytes = self.bytes_written
+            start_nodes = self.nodes_seen
+            self.nodes_seen += 1
+            started = time.perf_counter()
+            descend = enter(node)
+            stats = self.component_stats(node)
+            stats["nodes"] += 1
+            stats["seconds"] += time.perf_counter() - started
+            stats["bytes"] += self.bytes_written - start_bytes
+            if descend:
+                self.open_subtrees[id(node)] = (start_bytes, start_nodes)
+            else:
+                self.record_subtree(node, self.bytes_written - start_bytes, 1)
+            return descend
+
+        def profiled_leave(node: LayoutNode) -> None:
+            start_bytes = self.bytes_written
+            started = time.perf_counter()
+            leave(node)
+            stats = self.component_stats(node)
+            stats["seconds"] += time.perf_counter() - started
+            stats["bytes"] += self.bytes_written - start_bytes
+            subtree_start_bytes, subtree_start_nodes = self.open_subtrees.pop(id(node))
+            self.record_subtree(
+                node,
+                self.bytes_written - subtree_start_bytes,
+                self.nodes_seen - subtree_start_nodes,
+            )
+
+        return profiled_enter, profiled_leave
+
+    def report(self, output_bytes: int) -> Dict[str, Any]:
+        return {
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "components": {
+                label: {
+                    "nodes": int(stats["nodes"]),
+                    "seconds": round(stats["seconds"], 6),
+                    "bytes": int(stats["bytes"]),
+                }
+                for label, stats in sorted(self.components.items(), key=lambda item: -item[1]["bytes"])
+            },
+            "bytes": {
+                "total": output_bytes,
+                "inline_style": self.inline_style_bytes,
+                "markup": output_bytes - self.inline_style_bytes,
+            },
+            "heaviest_subtrees": [entry for _, _, entry in sorted(self.heaviest, reverse=True)],
+        }
+
+
+def profile_phase(profiler: Optional[BuildProfiler], name: str) -> ContextManager[None]:
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
+
+
+def print_profile_report(report: Dict[str, Any]) -> None:
+    print("Phase              ms")
+    for name, seconds in report["phases"].items():
+        print(f"  {name:<14} {seconds * 1000:>8.1f}")
+
+    print("Component          nodes        ms          bytes")
+    for label, stats in report["components"].items():
+        print(f"  {label:<14} {stats['nodes']:>7,} {stats['seconds'] * 1000:>9.1f} {stats['bytes']:>14,}")
+
+    totals = report["bytes"]
+    share = totals["inline_style"] / totals["total"] if totals["total"] else 0.0
+    print(
+        f"Inline style {totals['inline_style']:,} bytes ({share:.1%}), "
+        f"markup {totals['markup']:,} bytes"
+    )
+
+    print("Heaviest subtrees")
+    for entry in report["heaviest_subtrees"]:
+        print(
+            f"  {entry['bytes']:>12,} bytes {entry['nodes']:>6,} nodes  "
+            f"<{entry['tag']}> {entry['component']} {entry['id']}"
+        )
+
+
 class Renderer:
-    def __init__(self, live_metadata: Dict[str, Any]) -> None:
+    def __init__(
+        self,
+        live_metadata: Dict[str, Any],
+        shared_styles: bool = False,
+        fragment_cache: Optional[FragmentCache] = None,
+        profiler: Optional[BuildProfiler] = None,
+        minify: bool = False,
+        critical_css: bool = False,
+        critical_element_limit: int = CRITICAL_ELEMENT_LIMIT,
+        image_hints: bool = True,
+        eager_images: int = EAGER_IMAGE_COUNT,
+        image_index: Optional[ImageDimensionIndex] = None,
+        split_media_css: bool = False,
+        media_inline_threshold: int = MEDIA_CSS_INLINE_THRESHOLD,
+    ) -> None:
         self.class_counter = 0
         self.media_rules: Dict[str, List[str]] = {
             bp: [] for bp in BREAKPOINT_QUERIES
         }
         self.live_metadata = live_metadata
+        self.shared_styles = shared_styles
+        # (large css, *breakpoint css) -> shared class name, in first-seen order.
+        self.style_classes: Dict[Tuple[str, ...], str] = {}
+        self.fragment_cache = fragment_cache
+        # id(node) -> (subtree hash, node count, image count), filled per document.
+        self.subtree_info: Dict[int, Tuple[str, int, int]] = {}
+        self.slot_log: Optional[List[Tuple[str, ...]]] = None
+        self.profiler = profiler
+        self.minify = minify
+        # Open ancestors whose whitespace is significant; fragments under them
+        # are never minified.
+        self.preserve_whitespace_depth = 0
+        self.critical_css = critical_css
+        self.critical_element_limit = critical_element_limit
+        self.critical_css_bytes = 0
+        self.image_hints = image_hints
+        self.eager_images = eager_images
+        self.image_index = image_index
+        self.images_seen = 0
+        self.recorded_style_bytes = 0
+        self.split_media_css = split_media_css
+        self.media_inline_threshold = media_inline_threshold
+        # Breakpoint -> {"bytes": rule bytes, "href": linked file or None if inline}.
+        self.breakpoint_stats: Dict[str, Dict[str, Any]] = {}
 
     def next_class_name(self) -> str:
         self.class_counter += 1
         return f"bp-{self.class_counter}"
 
+    def register_breakpoint_rules(self, bp_css_values: Tuple[str, ...]) -> str:
+        class_name = self.next_class_name()
+        for bp, bp_css in zip(BREAKPOINT_QUERIES, bp_css_values):
+            if bp_css:
+                self.media_rules[bp].append(f".{class_name}{{{bp_css}}}")
+        return class_name
+
+    def claim_class(self, payload: Tuple[str, ...]) -> str:
+        # While a cacheable fragment is being recorded, class names are left as
+        # slots and assigned when the fragment is replayed, so numbering stays
+        # in document order whether or not the fragment came from the cache.
+        if self.slot_log is not None:
+            self.slot_log.append(payload)
+            return FRAGMENT_SLOT
+        if self.shared_styles:
+            return self.shared_class_name(payload)
+        return self.register_breakpoint_rules(payload)
+
+    def shared_class_name(self, style_key: Tuple[str, ...]) -> str:
+        class_name = self.style_classes.get(style_key)
+        if class_name is None:
+            class_name = f"s{to_base36(len(self.style_classes))}"
+            self.style_classes[style_key] = class_name
+        return class_name
+
+    def apply_shared_styles(
+        self,
+        node: LayoutNode,
+        attrs: Dict[str, str],
+    ) -> None:
+        if not any(node.styles):
+            return
+
+        class_name = self.claim_class(node.styles)
+        existing = attrs.get("class", "")
+        attrs["class"] = f"{existing} {class_name}".strip()
+
     def apply_responsive_styles(
         self,
-        node: Dict[str, Any],
+        node: LayoutNode,
         attrs: Dict[str, str],
     ) -> None:
-        styles = node.get("responsiveStyles") or {}
-        large_styles_raw = styles.get("large") or {}
+        if self.shared_styles:
+            self.apply_shared_styles(node, attrs)
+            return
 
-        tag_name = (node.get("tagName") or "").strip().lower()
-        large_styles = self.filter_styles(tag_name, large_styles_raw)
-        large_css = style_dict_to_css(large_styles)
+        large_css = node.styles[0]
         if large_css:
             attrs["style"] = large_css
+        if not node.has_breakpoint_styles:
+            return
 
-        class_name: str | None = None
-        for bp, query in BREAKPOINT_QUERIES.items():
-            bp_styles_raw = styles.get(bp) or {}
-            bp_styles = self.filter_styles(tag_name, bp_styles_raw)
-            if not bp_styles:
-                continue
-            if class_name is None:
-                class_name = self.next_class_name()
-                existing = attrs.get("class", "")
-                attrs["class"] = f"{existing} {class_name}".strip()
-
-            bp_css = style_dict_to_css(bp_styles)
-            if bp_css:
-                self.media_rules[bp].append(f".{class_name}{{{bp_css}}}")
-
-    def filter_styles(self, tag_name: str, style: Dict[str, str]) -> Dict[str, str]:
-        filtered: Dict[str, str] = {}
-        for key, value in style.items():
-            if key in DROP_STYLE_KEYS:
-                continue
-            if key == "fontFamily" and value in DROP_FONT_FAMILIES:
-                continue
-            if tag_name in {"html", "head", "title"}:
-                # Root/head/title visual styles are export artifacts.
-                continue
-            filtered[key] = value
-        return filtered
+        class_name = self.claim_class(node.styles[1:])
+        existing = attrs.get("class", "")
+        attrs["class"] = f"{existing} {class_name}".strip()
 
-    def build_base_attrs(
-        self,
-        node: Dict[str, Any],
-        component_name: str,
-    ) -> Dict[str, str]:
-        attrs: Dict[str, str] = {}
-        properties = node.get("properties") or {}
-        for key, value in properties.items():
-            attrs[key] = value
+    def build_base_attrs(self, node: LayoutNode) -> Dict[str, str]:
+        attrs: Dict[str, str] = dict(node.properties or {})
 
-        if node.get("id") and "id" not in attrs:
-            attrs["id"] = node["id"]
+        if node.node_id and "id" not in attrs:
+            attrs["id"] = node.node_id
 
-        if node.get("linkUrl") and "href" not in attrs:
-            attrs["href"] = node["linkUrl"]
+        if node.link_url and "href" not in attrs:
+            attrs["href"] = node.link_url
 
-        if component_name == "Raw:Img":
-            image = (node.get("component") or {}).get("options", {}).get("image")
-            if image and "src" not in attrs:
-                attrs["src"] = image
+        if node.component_name == "Raw:Img":
+            if node.image and "src" not in attrs:
+                attrs["src"] = node.image
+            if self.image_hints:
+                self.apply_image_hints(attrs)
 
         return attrs
 
-    def render_node(self, node: Dict[str, Any]) -> str:
-        if not isinstance(node, dict):
-            return ""
-
-        component = node.get("component") or {}
-        component_name = component.get("name", "")
-
-        tag_name = (node.get("tagName") or "").strip()
-        if component_name == "Raw:Img" and not tag_name:
-            tag_name = "img"
-        if not tag_name:
-            tag_name = "div"
-        tag_name = tag_name.lower()
-
-        if tag_name == "title":
-            attrs = self.build_base_attrs(node, component_name)
-            self.apply_responsive_styles(node, attrs)
-            attr_string = render_attrs(attrs)
-            title_text = collect_title_text(node)
-            return f"<title{attr_string}>{html.escape(title_text)}</title>"
-
-        attrs = self.build_base_attrs(node, component_name)
-        self.apply_responsive_styles(node, attrs)
-
-        attr_string = render_attrs(attrs)
-
-        if tag_name in VOID_TAGS:
-            return f"<{tag_name}{attr_string}>"
-
-        child_html_parts: List[str] = []
-
-        if component_name == "Text":
-            text_html = component.get("options", {}).get("text", "")
-            if text_html:
-                child_html_parts.append(text_html)
-        elif component_name == "Custom Code":
-            code_html = component.get("options", {}).get("code", "")
-            if code_html:
-                child_html_parts.append(code_html)
-
-        for child in node.get("children") or []:
-            if isinstance(child, dict):
-                child_html_parts.append(self.render_node(child))
-
-        inner_html = "".join(child_html_parts)
-        return f"<{tag_name}{attr_string}>{inner_html}</{tag_name}>"
+    def apply_image_hints(self, attrs: Dict[str, str]) -> None:
+        # The first `eager_images` images in document order are treated as
+        # above the fold: loaded eagerly at high priority. Everything after
+        # them is lazy, unless the layout already chose a loading mode.
+        # Intrinsic dimensions are only added when the layout gave neither,
+        # so the browser can reserve space before the bytes arrive.
+        self.images_seen += 1
+        if self.images_seen <= self.eager_images:
+            if attrs.setdefault("loading", "eager") == "eager":
+                attrs.setdefault("fetchpriority", "high")
+        else:
+            attrs.setdefault("loading", "lazy")
+        attrs.setdefault("decoding", "async")
+
+        local_path = local_image_path(str(attrs.get("src") or ""))
+        if local_path is None:
+            return
+        if "width" not in attrs and "height" not in attrs and self.image_index is not None:
+            dimensions = self.image_index.dimensions(local_path)
+            if dimensions:
+                attrs["width"], attrs["height"] = str(dimensions[0]), str(dimensions[1])
+
+        # Responsive variants let narrow viewports skip the full-size file.
+        # The image never renders wider than its width attribute, which
+        # bounds the slot the browser picks a candidate for.
+        srcset = image_srcset(local_path) if "srcset" not in attrs else None
+        if srcset:
+            attrs["srcset"] = srcset
+            width = attrs.get("width", "")
+            attrs.setdefault("sizes", f"(max-width: {width}px) 100vw, {width}px" if width.isdigit() else "100vw")
+
+    def write_node(self, node: LayoutNode, write: Callable[[str], Any]) -> None:
+        if self.fragment_cache is not None and id(node) not in self.subtree_info:
+            self.subtree_info.update(compute_subtree_info(node, self.cache_salt()))
+
+        def enter(current: LayoutNode) -> bool:
+            if self.is_cache_unit(current) and self.write_cached_fragment(current, write):
+                return False
+
+            tag_name = current.tag_name
+            attrs = self.build_base_attrs(current)
+            self.apply_responsive_styles(current, attrs)
+            if self.minify:
+                drop_default_attrs(tag_name, attrs)
+            attr_string = render_attrs(attrs, minify=self.minify)
+            if attrs.get("style") and (profiler is not None or self.slot_log is not None):
+                # Counted into the fragment while recording, so a replay can
+                # report the same bytes without rendering the subtree.
+                style_bytes = len(render_attrs({"style": attrs["style"]}, self.minify).encode("utf-8"))
+                if profiler is not None:
+                    profiler.inline_style_bytes += style_bytes
+                else:
+                    self.recorded_style_bytes += style_bytes
+
+            if tag_name == "title":
+                title_text = collect_title_text(current)
+                write(f"<title{attr_string}>{html.escape(title_text)}</title>")
+                return False
+
+            write(f"<{tag_name}{attr_string}>")
+            if tag_name in VOID_TAGS:
+                return False
+
+            if self.minify and current.preserve_whitespace:
+                self.preserve_whitespace_depth += 1
+            minify_fragment = self.minify and not self.preserve_whitespace_depth
+
+            if current.content:
+                write(minify_html_fragment(current.content) if minify_fragment else current.content)
+            return True
+
+        def leave(current: LayoutNode) -> None:
+            if self.minify and current.preserve_whitespace:
+                self.preserve_whitespace_depth -= 1
+            write(f"</{current.tag_name}>")
+
+        # Nodes recorded into a cache fragment are counted once, when replayed.
+        profiler = self.profiler if self.slot_log is None else None
+        if profiler is not None:
+            write = profiler.counting_writer(write)
+            enter, leave = profiler.instrument(enter, leave)
+
+        walk_layout(node, enter, leave)
+
+    def cache_salt(self) -> str:
+        style_mode = "shared" if self.shared_styles else "inline"
+        salt = f"{FRAGMENT_CACHE_VERSION}:{style_mode}:{'minify' if self.minify else 'raw'}"
+        if self.image_hints:
+            # Probed dimensions come from the mirrored files, which change with the manifest.
+            salt = f"{salt}:images:{media_manifest_fingerprint() if self.image_index else 'none'}"
+        return salt
+
+    def is_cache_unit(self, node: LayoutNode) -> bool:
+        # The walk only reaches a small subtree when every ancestor was too big
+        # to cache, so small subtrees reached here are maximal cache units.
+        if self.fragment_cache is None or self.slot_log is not None:
+            return False
+        info = self.subtree_info.get(id(node))
+        if info is None or info[1] > FRAGMENT_CACHE_MAX_NODES:
+            return False
+        # Eager/lazy loading depends on an image's position in the document,
+        # so subtrees holding any of the first images are always rendered.
+        return not (self.image_hints and info[2] and self.images_seen < self.eager_images)
+
+    def record_fragment(self, node: LayoutNode) -> Optional[Dict[str, Any]]:
+        buffer = io.StringIO()
+        images_before = self.images_seen
+        style_bytes_before = self.recorded_style_bytes
+        self.slot_log = []
+        try:
+            self.write_node(node, buffer.write)
+            slots = self.slot_log
+        finally:
+            self.slot_log = None
+
+        parts = buffer.getvalue().split(FRAGMENT_SLOT)
+        if len(parts) != len(slots) + 1:
+            # The content itself contains the slot marker; render uncached.
+            return None
+        return {
+            "parts": parts,
+            "slots": [list(slot) for slot in slots],
+            "images": self.images_seen - images_before,
+            "inline_style_bytes": self.recorded_style_bytes - style_bytes_before,
+        }
 
-    def render_media_query_css(self) -> str:
-        chunks: List[str] = []
-        for bp, query in BREAKPOINT_QUERIES.items():
-            rules = self.media_rules.get(bp) or []
-            if not rules:
+    def write_cached_fragment(self, node: LayoutNode, write: Callable[[str], Any]) -> bool:
+        assert self.fragment_cache is not None
+        key = self.subtree_info[id(node)][0]
+        if self.preserve_whitespace_depth:
+            # Minification depends on ancestors here, not just the subtree.
+            key = f"{key}:pre"
+        fragment = self.fragment_cache.get(key)
+        if fragment is None:
+            fragment = self.record_fragment(node)
+            if fragment is None:
+                return False
+            self.fragment_cache.put(key, fragment)
+        else:
+            # Replayed images still count towards the eager limit and stats.
+            self.images_seen += fragment["images"]
+        if self.profiler is not None:
+            self.profiler.inline_style_bytes += fragment["inline_style_bytes"]
+
+        parts = fragment["parts"]
+        write(parts[0])
+        for slot, part in zip(fragment["slots"], parts[1:]):
+            write(self.claim_class(tuple(slot)))
+            write(part)
+        return True
+
+    def render_node(self, node: LayoutNode) -> str:
+        buffer = io.StringIO()
+        self.write_node(node, buffer.write)
+        return buffer.getvalue()
+
+    def render_shared_style_css(self) -> str:
+        base_rules: Dict[str, List[str]] = {}
+        for style_key, class_name in self.style_classes.items():
+            if style_key[0]:
+                base_rules.setdefault(style_key[0], []).append(class_name)
+        return group_rules(base_rules)
+
+    def breakpoint_css(self) -> Dict[str, str]:
+        # Breakpoint -> its rules without the @media wrapper, for breakpoints
+        # that have any, in BREAKPOINT_QUERIES order.
+        if self.shared_styles:
+            return self.shared_breakpoint_css()
+        return {bp: "".join(rules) for bp, rules in self.media_rules.items() if rules}
+
+    def shared_breakpoint_css(self) -> Dict[str, str]:
+        css_by_bp: Dict[str, str] = {}
+        for index, bp in enumerate(BREAKPOINT_QUERIES, start=1):
+            rules: Dict[str, List[str]] = {}
+            for style_key, class_name in self.style_classes.items():
+                if style_key[index]:
+                    rules.setdefault(style_key[index], []).append(class_name)
+            if rules:
+                css_by_bp[bp] = group_rules(rules)
+        return css_by_bp
+
+    def write_breakpoint_css(
+        self,
+        write: Callable[[str], Any],
+        base_css: str,
+        css_by_bp: Dict[str, str],
+    ) -> None:
+        # Inline breakpoints join the <style> block; with split_media_css the
+        # ones past the threshold become media-scoped links instead. Output
+        # keeps BREAKPOINT_QUERIES order so narrower breakpoints still win.
+        pending = [base_css]
+        for bp, css in css_by_bp.items():
+            query = BREAKPOINT_QUERIES[bp]
+            css_bytes = len(css.encode("utf-8"))
+            self.breakpoint_stats[bp] = {"bytes": css_bytes, "href": None}
+            if not self.split_media_css or css_bytes < self.media_inline_threshold:
+                pending.append(f"@media {query}{{{css}}}")
                 continue
-            chunks.append(f"@media {query}{{{''.join(rules)}}}")
-        return "\n".join(chunks)
-
-    def render_document(self, root: Dict[str, Any]) -> str:
-        root_component_name = ((root.get("component") or {}).get("name", ""))
-        html_attrs = self.build_base_attrs(root, root_component_name)
-        self.apply_responsive_styles(root, html_attrs)
-
-        live_html_class = self.live_metadata.get("html_class", "")
-        if live_html_class:
-            html_attrs["class"] = f"{html_attrs.get('class', '')} {live_html_class}".strip()
-
-        children = [child for child in (root.get("children") or []) if isinstance(child, dict)]
-        head_nodes = [child for child in children if (child.get("tagName") or "").lower() == "head"]
-        body_nodes = [child for child in children if (child.get("tagName") or "").lower() != "head"]
-        head_attrs: Dict[str, str] = {}
-
-        if head_nodes:
-            primary_head = head_nodes[0]
-            primary_head_component = ((primary_head.get("component") or {}).get("name", ""))
-            head_attrs = self.build_base_attrs(primary_head, primary_head_component)
-            self.apply_responsive_styles(primary_head, head_attrs)
-
-        head_parts: List[str] = [
-            '<meta charset="utf-8">',
-            '<meta name="viewport" content="width=device-width, initial-scale=1">',
-        ]
+            if pending:
+                pending_css = "\n".join(pending)
+                write(f"<style>{pending_css}</style>")
+                pending = []
+            href = write_breakpoint_stylesheet(bp, css)
+            self.breakpoint_stats[bp]["href"] = href
+            write(
+                f'<link rel="stylesheet" href="{html.escape(href, quote=True)}" '
+                f'media="{html.escape(query, quote=True)}">'
+            )
+        if pending:
+            pending_css = "\n".join(pending)
+            write(f"<style>{pending_css}</style>")
+
+    def profile_phase(self, name: str) -> ContextManager[None]:
+        return profile_phase(self.profiler, name)
+
+    def body_attrs(self) -> Dict[str, str]:
+        body_attrs: Dict[str, str] = {}
+        live_body_class = self.live_metadata.get("body_class", "")
+        if live_body_class:
+            body_attrs["class"] = live_body_class
+        return body_attrs
 
-        for head_node in head_nodes:
-            for child in head_node.get("children") or []:
-                if isinstance(child, dict):
-                    head_parts.append(self.render_node(child))
+    def write_font_preloads(self, write: Callable[[str], Any]) -> None:
+        # Fonts listed under "preload" in the asset manifest start downloading
+        # with the stylesheets instead of after the CSS has been parsed.
+        for font_url in self.live_metadata.get("font_preloads", []):
+            mime_type = FONT_MIME_TYPES.get(Path(urlparse(font_url).path).suffix.lower())
+            type_attr = f' type="{mime_type}"' if mime_type else ""
+            write(f'<link rel="preload" href="{html.escape(font_url, quote=True)}" as="font"{type_attr} crossorigin>')
 
+    def write_critical_stylesheets(
+        self,
+        write: Callable[[str], Any],
+        document_prefix: List[str],
+        body_source: TextIO,
+    ) -> None:
+        # Inlines the rules that can match the first `critical_element_limit`
+        # body elements and turns local stylesheets into non-blocking preloads.
+        collector = DocumentTokenCollector(self.critical_element_limit)
+        for chunk in document_prefix:
+            collector.feed(chunk)
+        for chunk in iter(lambda: body_source.read(CRITICAL_SCAN_CHUNK_SIZE), ""):
+            collector.feed(chunk)
+            if collector.done:
+                break
+
+        critical_chunks: List[str] = []
+        deferred_urls: List[str] = []
+        blocking_urls: List[str] = []
         for stylesheet_url in self.live_metadata.get("stylesheet_urls", []):
+            local_path = local_stylesheet_path(stylesheet_url)
+            if local_path is None:
+                blocking_urls.append(stylesheet_url)
+                continue
+            rules = load_stylesheet_rules(str(local_path), local_path.stat().st_mtime_ns)
+            critical_css = serialize_rules(filter_rules(rules, collector.tokens))
+            if critical_css:
+                critical_chunks.append(rebase_css_urls(critical_css, stylesheet_url))
+            deferred_urls.append(stylesheet_url)
+
+        self.critical_css_bytes = sum(len(chunk.encode("utf-8")) for chunk in critical_chunks)
+        for stylesheet_url in blocking_urls:
+            write(f'<link rel="stylesheet" href="{html.escape(stylesheet_url, quote=True)}">')
+        if critical_chunks:
+            write(f"<style>{''.join(critical_chunks)}</style>")
+        for stylesheet_url in deferred_urls:
             escaped_url = html.escape(stylesheet_url, quote=True)
-            head_parts.append(f'<link rel="stylesheet" href="{escaped_url}">')
+            write(
+                f'<link rel="preload" href="{escaped_url}" as="style" '
+                "onload=\"this.onload=null;this.rel='stylesheet'\">"
+                f'<noscript><link rel="stylesheet" href="{escaped_url}"></noscript>'
+            )
+
+    def write_document(self, root: LayoutNode, sink: TextIO) -> None:
+        with self.profile_phase("head_render"):
+            html_attrs = self.build_base_attrs(root)
+            self.apply_responsive_styles(root, html_attrs)
+
+            live_html_class = self.live_metadata.get("html_class", "")
+            if live_html_class:
+                html_attrs["class"] = f"{html_attrs.get('class', '')} {live_html_class}".strip()
+
+            head_nodes = [child for child in root.children if child.tag_name == "head"]
+            body_nodes = [child for child in root.children if child.tag_name != "head"]
+            head_attrs: Dict[str, str] = {}
+
+            if head_nodes:
+                primary_head = head_nodes[0]
+                head_attrs = self.build_base_attrs(primary_head)
+                self.apply_responsive_styles(primary_head, head_attrs)
+
+            write = sink.write
+            write("<!doctype html>")
+            write(f"<html{render_attrs(html_attrs, self.minify)}>")
+            write(f"<head{render_attrs(head_attrs, self.minify)}>")
+            write('<meta charset="utf-8">')
+            write('<meta name="viewport" content="width=device-width, initial-scale=1">')
+
+            for head_node in head_nodes:
+                for child in head_node.children:
+                    self.write_node(child, write)
+
+        # The <style> block depends on every body node, so the body is spooled
+        # (rolling over to disk past BODY_SPOOL_MAX_SIZE) and copied in after it.
+        with tempfile.SpooledTemporaryFile(
+            max_size=BODY_SPOOL_MAX_SIZE,
+            mode="w+",
+            encoding="utf-8",
+        ) as body_spool:
+            with self.profile_phase("body_render"):
+                for node in body_nodes:
+                    self.write_node(node, body_spool.write)
+
+            with self.profile_phase("media_css"):
+                css_by_bp = self.breakpoint_css()
+                global_css = "html,body{margin:0;padding:0;box-sizing:border-box;}*,*::before,*::after{box-sizing:inherit;}"
+                if self.shared_styles:
+                    shared_css = self.render_shared_style_css()
+                    if shared_css:
+                        global_css = f"{global_css}\n{shared_css}"
+
+            with self.profile_phase("stylesheets"):
+                self.write_font_preloads(write)
+                if self.critical_css:
+                    body_spool.seek(0)
+                    self.write_critical_stylesheets(
+                        write,
+                        [f"<html{render_attrs(html_attrs)}>", f"<body{render_attrs(self.body_attrs())}>"],
+                        body_spool,
+                    )
+                else:
+                    for stylesheet_url in self.live_metadata.get("stylesheet_urls", []):
+                        escaped_url = html.escape(stylesheet_url, quote=True)
+                        write(f'<link rel="stylesheet" href="{escaped_url}">')
+
+            with self.profile_phase("write"):
+                self.write_breakpoint_css(write, global_css, css_by_bp)
+                write("</head>")
+
+                write(f"<body{render_attrs(self.body_attrs(), self.minify)}>")
+                body_spool.seek(0)
+                shutil.copyfileobj(body_spool, sink)
+                write("</body>")
+                write("</html>")
+
+    def render_document(self, root: LayoutNode) -> str:
+        buffer = io.StringIO()
+        self.write_document(root, buffer)
+        return buffer.getvalue()
+
+
+def load_layout_root(input_path: Path) -> Dict[str, Any]:
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input not found: {input_path}")
+
+    layout = json.loads(input_path.read_text(encoding="utf-8"))
+    blocks = (layout.get("data") or {}).get("blocks") or []
+    if not blocks:
+        raise ValueError(f"No blocks found at data.blocks in {input_path}")
+    return blocks[0]
+
+
+def resolve_layout_paths(patterns: List[str]) -> List[Path]:
+    paths: List[Path] = []
+    for pattern in patterns:
+        candidate = Path(pattern)
+        if candidate.is_dir():
+            paths.extend(sorted(candidate.glob("*.json")))
+        elif glob.has_magic(pattern):
+            paths.extend(Path(match) for match in sorted(glob.glob(pattern)))
+        else:
+            paths.append(candidate)
+    return [Path(value) for value in uniq_keep_order([str(path) for path in paths])]
+
+
+def load_compact_layout(
+    input_path: Path,
+    cache_dir: Optional[Path] = LAYOUT_CACHE_DIR,
+    optimize: bool = False,
+) -> Tuple[LayoutNode, Dict[str, int], bool]:
+    # Returns (root, optimize_tree stats, cache hit). The compact tree is
+    # pickled under `cache_dir` keyed by the layout file's hash, so unchanged
+    # layouts skip JSON parsing, optimization and style compilation.
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input not found: {input_path}")
+
+    cache_path: Optional[Path] = None
+    if cache_dir is not None:
+        digest = hashlib.sha1(input_path.read_bytes()).hexdigest()
+        variant = "optimized" if optimize else "plain"
+        cache_path = cache_dir / f"{digest}-{variant}-{LAYOUT_CACHE_SCHEMA}.pickle"
+        try:
+            with cache_path.open("rb") as cache_file:
+                cached = pickle.load(cache_file)
+            return inflate_layout(cached["rows"]), cached["tree_stats"], True
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError, ValueError):
+            pass
+
+    root = load_layout_root(input_path)
+    tree_stats: Dict[str, int] = {}
+    if optimize:
+        root, tree_stats = optimize_tree(root)
+    compact_root = compact_tree(root)
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_path.open("wb") as cache_file:
+            payload = {"rows": flatten_layout(compact_root), "tree_stats": tree_stats}
+            pickle.dump(payload, cache_file, pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(cache_path)
+    return compact_root, tree_stats, False
+
+
+def render_page(
+    root: LayoutNode,
+    output_path: Path,
+    live_metadata: Dict[str, Any],
+    renderer_options: Optional[Dict[str, Any]] = None,
+    fragment_cache: Optional[FragmentCache] = None,
+    image_index: Optional[ImageDimensionIndex] = None,
+    profiler: Optional[BuildProfiler] = None,
+    precompress: bool = False,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    renderer = Renderer(
+        live_metadata,
+        fragment_cache=fragment_cache,
+        profiler=profiler,
+        image_index=image_index,
+        **(renderer_options or {}),
+    )
+    # Rendered next to the target and renamed over it, so servers and
+    # browsers never see a half-written page.
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp_path.open("w", encoding="utf-8") as output_file:
+            renderer.write_document(root, output_file)
+        tmp_path.replace(output_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    compressed: Dict[str, int] = {}
+    if precompress:
+        with profile_phase(profiler, "precompress"):
+            compressed = write_precompressed(output_path)
+    else:
+        remove_precompressed(output_path)
+    return {
+        "output": str(output_path),
+        "seconds": time.perf_counter() - started,
+        "bytes": output_path.stat().st_size,
+        "compressed_bytes": compressed,
+        "cache_hits": fragment_cache.hits if fragment_cache else 0,
+        "cache_misses": fragment_cache.misses if fragment_cache else 0,
+        "style_classes": len(renderer.style_classes),
+        "critical_css_bytes": renderer.critical_css_bytes,
+        "images": renderer.images_seen,
+        "breakpoint_css": renderer.breakpoint_stats,
+    }
 
-        body_parts = [self.render_node(node) for node in body_nodes]
 
-        media_css = self.render_media_query_css()
-        global_css = "html,body{margin:0;padding:0;box-sizing:border-box;}*,*::before,*::after{box-sizing:inherit;}"
-        if media_css:
-            global_css = f"{global_css}\n{media_css}"
+def build_page(
+    input_path: Path,
+    output_path: Path,
+    live_metadata: Dict[str, Any],
+    renderer_options: Optional[Dict[str, Any]] = None,
+    cache_dir: Optional[Path] = None,
+    profiler: Optional[BuildProfiler] = None,
+    precompress: bool = False,
+    optimize: bool = False,
+    layout_cache_dir: Optional[Path] = LAYOUT_CACHE_DIR,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with profile_phase(profiler, "layout_load"):
+        root, tree_stats, layout_cache_hit = load_compact_layout(input_path, layout_cache_dir, optimize)
+    renderer_options = renderer_options or {}
+    fragment_cache = FragmentCache(cache_dir / f"{output_path.stem}.json") if cache_dir else None
+    image_index = ImageDimensionIndex(IMAGE_INDEX_PATH) if renderer_options.get("image_hints", True) else None
+    result = render_page(
+        root,
+        output_path,
+        live_metadata,
+        renderer_options,
+        fragment_cache,
+        image_index,
+        profiler,
+        precompress,
+    )
+    if fragment_cache is not None:
+        fragment_cache.save()
+    if image_index is not None:
+        image_index.save()
+    return {
+        "input": str(input_path),
+        **result,
+        "seconds": time.perf_counter() - started,
+        "tree": tree_stats,
+        "layout_cache_hit": layout_cache_hit,
+    }
 
-        head_parts.append(f"<style>{global_css}</style>")
 
-        html_attr_string = render_attrs(html_attrs)
-        head_html = "".join(head_parts)
-        body_html = "".join(body_parts)
-        head_attr_string = render_attrs(head_attrs)
-        body_attrs: Dict[str, str] = {}
-        live_body_class = self.live_metadata.get("body_class", "")
-        if live_body_class:
-            body_attrs["class"] = live_body_class
-        body_attr_string = render_attrs(body_attrs)
-        return (
-            "<!doctype html>"
-            f"<html{html_attr_string}>"
-            f"<head{head_attr_string}>{head_html}</head>"
-            f"<body{body_attr_string}>{body_html}</body>"
-            "</html>"
+_WORKER_METADATA: Dict[str, Any] = {}
+
+
+def init_batch_worker(live_metadata: Dict[str, Any]) -> None:
+    # Metadata is resolved once in the parent and handed to each worker on start.
+    _WORKER_METADATA.clear()
+    _WORKER_METADATA.update(live_metadata)
+
+
+def build_page_in_worker(
+    input_path: Path,
+    output_path: Path,
+    renderer_options: Dict[str, Any],
+    cache_dir: Optional[Path],
+    precompress: bool,
+    optimize: bool,
+    layout_cache_dir: Optional[Path],
+) -> Dict[str, Any]:
+    return build_page(
+        input_path,
+        output_path,
+        _WORKER_METADATA,
+        renderer_options,
+        cache_dir,
+        precompress=precompress,
+        optimize=optimize,
+        layout_cache_dir=layout_cache_dir,
+    )
+
+
+def run_batch(
+    input_paths: List[Path],
+    output_dir: Path,
+    live_metadata: Dict[str, Any],
+    jobs: int,
+    renderer_options: Optional[Dict[str, Any]] = None,
+    cache_dir: Optional[Path] = None,
+    precompress: bool = False,
+    optimize: bool = False,
+    layout_cache_dir: Optional[Path] = LAYOUT_CACHE_DIR,
+) -> List[Dict[str, Any]]:
+    renderer_options = renderer_options or {}
+    # Pages and their fragment caches are named after the layout's stem, so
+    # two layouts sharing a stem would overwrite each other's output.
+    by_stem: Dict[str, List[str]] = {}
+    for path in input_paths:
+        by_stem.setdefault(path.stem, []).append(str(path))
+    clashes = [paths for paths in by_stem.values() if len(paths) > 1]
+    if clashes:
+        raise ValueError(
+            "Layouts with the same file name would write the same output: "
+            + "; ".join(", ".join(paths) for paths in clashes)
         )
+    targets = [(path, output_dir / f"{path.stem}.html") for path in input_paths]
+    if jobs <= 1 or len(targets) <= 1:
+        return [
+            build_page(
+                input_path,
+                output_path,
+                live_metadata,
+                renderer_options,
+                cache_dir,
+                precompress=precompress,
+                optimize=optimize,
+                layout_cache_dir=layout_cache_dir,
+            )
+            for input_path, output_path in targets
+        ]
 
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(targets)),
+        initializer=init_batch_worker,
+        initargs=(live_metadata,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                build_page_in_worker,
+                input_path,
+                output_path,
+                renderer_options,
+                cache_dir,
+                precompress,
+                optimize,
+                layout_cache_dir,
+            )
+            for input_path, output_path in targets
+        ]
+        return [future.result() for future in futures]
 
-def main() -> None:
-    if not INPUT_PATH.exists():
-        raise FileNotFoundError(f"Input not found: {INPUT_PATH}")
 
-    layout = json.loads(INPUT_PATH.read_text(encoding="utf-8"))
-    blocks = (layout.get("data") or {}).get("blocks") or []
-    if not blocks:
-        raise ValueError("No blocks found at data.blocks")
+def file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watched_metadata_paths(live_metadata: Dict[str, Any], renderer_options: Dict[str, Any]) -> List[Path]:
+    # Local inputs besides the layout that change the rendered page.
+    paths = [LOCAL_MIRROR_HTML, ASSET_MANIFEST_PATH, MEDIA_MANIFEST_PATH]
+    if renderer_options.get("critical_css"):
+        for stylesheet_url in live_metadata.get("stylesheet_urls", []):
+            local_path = local_stylesheet_path(stylesheet_url)
+            if local_path is not None:
+                paths.append(local_path)
+    return paths
+
+
+def watch_page(
+    input_path: Path,
+    output_path: Path,
+    live_metadata: Dict[str, Any],
+    renderer_options: Dict[str, Any],
+    cache_dir: Optional[Path] = None,
+    precompress: bool = False,
+    optimize: bool = False,
+    layout_cache_dir: Optional[Path] = LAYOUT_CACHE_DIR,
+    poll_seconds: float = WATCH_POLL_SECONDS,
+) -> None:
+    # Keeps the compact tree, metadata and caches resident and re-renders
+    # whenever one of the inputs changes on disk. A layout that fails to
+    # parse (e.g. caught mid-save) keeps the previous tree until fixed.
+    fragment_cache = FragmentCache(cache_dir / f"{output_path.stem}.json") if cache_dir else None
+    image_index = ImageDimensionIndex(IMAGE_INDEX_PATH) if renderer_options.get("image_hints", True) else None
+    root, _, _ = load_compact_layout(input_path, layout_cache_dir, optimize)
+
+    def snapshot() -> Dict[Path, Optional[Tuple[int, int]]]:
+        paths = [input_path, *watched_metadata_paths(live_metadata, renderer_options)]
+        return {path: file_signature(path) for path in paths}
+
+    def rebuild(reason: str, started: float) -> None:
+        # Latency covers reloading changed inputs as well as the render.
+        if fragment_cache is not None and (fragment_cache.used or fragment_cache.entries):
+            fragment_cache.next_build()
+        result = render_page(
+            root,
+            output_path,
+            live_metadata,
+            renderer_options,
+            fragment_cache,
+            image_index,
+            precompress=precompress,
+        )
+        if renderer_options.get("split_media_css"):
+            prune_breakpoint_stylesheets([result])
+        if image_index is not None:
+            image_index.save()
+        print(
+            f"[{time.strftime('%H:%M:%S')}] Wrote {output_path} ({result['bytes']:,} bytes) "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms ({reason})",
+            flush=True,
+        )
 
-    root = blocks[0]
-    live_metadata = fetch_live_site_metadata()
-    renderer = Renderer(live_metadata)
-    output_html = renderer.render_document(root)
-    OUTPUT_PATH.write_text(output_html, encoding="utf-8")
+    signatures = snapshot()
+    rebuild("initial build", time.perf_counter())
+    print(f"Watching {len(signatures)} inputs for changes (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(poll_seconds)
+            current = snapshot()
+            if current == signatures:
+                continue
+            # Editors often save in several writes; wait for the files to settle.
+            time.sleep(WATCH_SETTLE_SECONDS)
+            settled = snapshot()
+            if settled != current:
+                continue
 
-    print(f"Wrote {OUTPUT_PATH} ({len(output_html):,} bytes)")
+            started = time.perf_counter()
+            changed = [path for path, signature in settled.items() if signatures.get(path) != signature]
+            signatures = settled
+            if input_path in changed:
+                try:
+                    root, _, _ = load_compact_layout(input_path, layout_cache_dir, optimize)
+                except (OSError, ValueError) as error:
+                    print(f"Skipped rebuild, {input_path} did not load: {error}", flush=True)
+                    continue
+            if any(path in (LOCAL_MIRROR_HTML, ASSET_MANIFEST_PATH) for path in changed):
+                live_metadata = resolve_live_site_metadata()
+                signatures = snapshot()
+            rebuild(f"changed: {', '.join(str(path) for path in changed)}", started)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        if fragment_cache is not None:
+            fragment_cache.save()
+
+
+def format_compressed_sizes(raw_bytes: int, compressed: Dict[str, int]) -> str:
+    return ", ".join(
+        f"{encoding} {size:,} bytes ({size / raw_bytes:.1%})" if raw_bytes else f"{encoding} {size:,} bytes"
+        for encoding, size in compressed.items()
+    )
+
+
+def format_breakpoint_css(breakpoint_stats: Dict[str, Dict[str, Any]]) -> str:
+    return ", ".join(
+        f"{bp} {stats['bytes']:,} bytes ({stats['href'] or 'inline'})"
+        for bp, stats in breakpoint_stats.items()
+    )
+
+
+def format_tree_stats(tree_stats: Dict[str, int]) -> str:
+    return (
+        f"{tree_stats['nodes_before']:,} -> {tree_stats['nodes_after']:,} nodes "
+        f"({tree_stats['hidden_subtrees']:,} hidden subtrees with {tree_stats['hidden_nodes']:,} nodes, "
+        f"{tree_stats['empty_elements']:,} empty elements, {tree_stats['wrappers']:,} wrappers, "
+        f"{tree_stats['merged_text']:,} Text merges)"
+    )
+
+
+def measure_document(root: LayoutNode, live_metadata: Dict[str, Any], renderer_options: Dict[str, Any]) -> int:
+    # Rendered size with every stylesheet inline, so no files are written.
+    options = {**renderer_options, "split_media_css": False}
+    image_index = ImageDimensionIndex(IMAGE_INDEX_PATH) if options.get("image_hints", True) else None
+    counter = ByteCounter()
+    Renderer(live_metadata, image_index=image_index, **options).write_document(root, counter)
+    return counter.size
+
+
+def print_batch_summary(results: List[Dict[str, Any]], elapsed: float) -> None:
+    for result in results:
+        print(f"{result['seconds']:8.3f}s {result['bytes']:>12,} bytes  {result['output']}")
+        if result["compressed_bytes"]:
+            print(f"          {format_compressed_sizes(result['bytes'], result['compressed_bytes'])}")
+        if result["breakpoint_css"]:
+            print(f"          {format_breakpoint_css(result['breakpoint_css'])}")
+        if result["tree"]:
+            print(f"          {format_tree_stats(result['tree'])}")
+    total_bytes = sum(result["bytes"] for result in results)
+    render_seconds = sum(result["seconds"] for result in results)
+    print(
+        f"Built {len(results)} pages ({total_bytes:,} bytes) in {elapsed:.3f}s "
+        f"wall, {render_seconds:.3f}s render"
+    )
+    cache_hits = sum(result["cache_hits"] for result in results)
+    cache_misses = sum(result["cache_misses"] for result in results)
+    if cache_hits or cache_misses:
+        print(f"Fragment cache: {cache_hits:,} hits, {cache_misses:,} misses")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Render a Builder.io layout export to static HTML.")
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help=f"layout JSON files, directories or glob patterns to build in batch (default: {INPUT_PATH})",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=BATCH_OUTPUT_DIR,
+        help=f"directory for batch output, one <layout-stem>.html per input (default: {BATCH_OUTPUT_DIR})",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="worker processes for batch builds (default: CPU count)",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"reuse rendered subtree fragments from a per-page cache in {FRAGMENT_CACHE_DIR}/",
+    )
+    parser.add_argument(
+        "--refresh-metadata",
+        action="store_true",
+        help=f"scrape html/body classes and stylesheets from {LIVE_SITE_URL} instead of local sources",
+    )
+    parser.add_argument(
+        "--shared-styles",
+        action="store_true",
+        help="intern identical style sets into shared classes instead of inline style attributes",
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="collapse whitespace in Text/Custom Code HTML, unquote safe attribute values and drop default attributes",
+    )
+    parser.add_argument(
+        "--critical-css",
+        action="store_true",
+        help="inline the local stylesheet rules used by the first body elements and preload the full sheets",
+    )
+    parser.add_argument(
+        "--critical-elements",
+        type=int,
+        default=CRITICAL_ELEMENT_LIMIT,
+        help=f"body elements treated as above the fold for --critical-css (default: {CRITICAL_ELEMENT_LIMIT})",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep the layout and metadata in memory and rebuild whenever an input file changes",
+    )
+    parser.add_argument(
+        "--no-layout-cache",
+        dest="layout_cache",
+        action="store_false",
+        help=f"always parse the layout JSON instead of loading the compact tree pickled in {LAYOUT_CACHE_DIR}/",
+    )
+    parser.add_argument(
+        "--optimize-tree",
+        action="store_true",
+        help="drop hidden and empty elements, collapse no-op wrappers and merge adjacent Text before rendering",
+    )
+    parser.add_argument(
+        "--split-media-css",
+        action="store_true",
+        help=f"write each breakpoint's rules to a content-hashed file in {BREAKPOINT_CSS_DIR}/ linked with its media query",
+    )
+    parser.add_argument(
+        "--media-inline-threshold",
+        type=int,
+        default=MEDIA_CSS_INLINE_THRESHOLD,
+        help=f"breakpoints with fewer rule bytes than this stay inline with --split-media-css (default: {MEDIA_CSS_INLINE_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--no-image-hints",
+        dest="image_hints",
+        action="store_false",
+        help="leave Raw:Img attributes as exported instead of adding loading/decoding hints and intrinsic sizes",
+    )
+    parser.add_argument(
+        "--eager-images",
+        type=int,
+        default=EAGER_IMAGE_COUNT,
+        help=f"leading images loaded eagerly at high priority; the rest are lazy (default: {EAGER_IMAGE_COUNT})",
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store_true",
+        help="write .gz (and .br/.zst when brotli/zstandard are installed) siblings at maximum compression",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=Path,
+        const=PROFILE_REPORT_PATH,
+        help=f"record phase timings and per-component counters to a JSON report (default: {PROFILE_REPORT_PATH})",
+    )
+    args = parser.parse_args()
+    if args.profile and args.inputs:
+        parser.error("--profile applies to single-page builds only")
+    if args.watch and (args.inputs or args.profile):
+        parser.error("--watch applies to single-page builds without --profile")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    layout_cache_dir = LAYOUT_CACHE_DIR if args.layout_cache else None
+    renderer_options = {
+        "shared_styles": args.shared_styles,
+        "minify": args.minify,
+        "critical_css": args.critical_css,
+        "critical_element_limit": args.critical_elements,
+        "image_hints": args.image_hints,
+        "eager_images": args.eager_images,
+        "split_media_css": args.split_media_css,
+        "media_inline_threshold": args.media_inline_threshold,
+    }
+    if args.inputs:
+        input_paths = resolve_layout_paths(args.inputs)
+        if not input_paths:
+            raise FileNotFoundError(f"No layout files matched: {' '.join(args.inputs)}")
+
+        started = time.perf_counter()
+        live_metadata = resolve_live_site_metadata(args.refresh_metadata)
+        cache_dir = FRAGMENT_CACHE_DIR if args.cache else None
+        results = run_batch(
+            input_paths,
+            args.output_dir,
+            live_metadata,
+            args.jobs,
+            renderer_options,
+            cache_dir,
+            args.precompress,
+            args.optimize_tree,
+            layout_cache_dir,
+        )
+        if args.split_media_css:
+            prune_breakpoint_stylesheets(results)
+        print_batch_summary(results, time.perf_counter() - started)
+        print(f"Live metadata source: {live_metadata.get('source', 'unknown')}")
+        return
+
+    if args.watch:
+        watch_page(
+            INPUT_PATH,
+            OUTPUT_PATH,
+            resolve_live_site_metadata(args.refresh_metadata),
+            renderer_options,
+            FRAGMENT_CACHE_DIR if args.cache else None,
+            args.precompress,
+            args.optimize_tree,
+            layout_cache_dir,
+        )
+        return
+
+    profiler = BuildProfiler() if args.profile else None
+    with profile_phase(profiler, "metadata"):
+        live_metadata = resolve_live_site_metadata(args.refresh_metadata)
+    cache_dir = FRAGMENT_CACHE_DIR if args.cache else None
+    result = build_page(
+        INPUT_PATH,
+        OUTPUT_PATH,
+        live_metadata,
+        renderer_options,
+        cache_dir,
+        profiler,
+        args.precompress,
+        args.optimize_tree,
+        layout_cache_dir,
+    )
+    if args.split_media_css:
+        prune_breakpoint_stylesheets([result])
+    output_size = result["bytes"]
+
+    print(f"Wrote {OUTPUT_PATH} ({output_size:,} bytes) in {result['seconds']:.3f}s")
+    if result["compressed_bytes"]:
+        print(f"Precompressed: {format_compressed_sizes(output_size, result['compressed_bytes'])}")
+    print(f"Live metadata source: {live_metadata.get('source', 'unknown')}")
+    if layout_cache_dir is not None:
+        print(f"Layout cache: {'hit' if result['layout_cache_hit'] else 'miss'}")
+    if result["breakpoint_css"]:
+        print(f"Breakpoint CSS: {format_breakpoint_css(result['breakpoint_css'])}")
+    style_stats = style_cache_stats()
+    if style_stats["css"]["hits"] or style_stats["css"]["misses"]:
+        # Styles are compiled while building the compact tree, so a layout
+        # cache hit never reaches the style caches.
+        print(
+            f"Style cache hit rate: kebab {style_stats['kebab']['hit_rate']:.1%}, "
+            f"css {style_stats['css']['hit_rate']:.1%} ({style_stats['css']['size']:,} entries)"
+        )
+    if args.cache:
+        print(f"Fragment cache: {result['cache_hits']:,} hits, {result['cache_misses']:,} misses")
+    if args.critical_css:
+        print(f"Critical CSS inlined: {result['critical_css_bytes']:,} bytes")
+    if result["tree"]:
+        original_root = load_compact_layout(INPUT_PATH, layout_cache_dir)[0]
+        optimized_root = load_compact_layout(INPUT_PATH, layout_cache_dir, optimize=True)[0]
+        original_size = measure_document(original_root, live_metadata, renderer_options)
+        optimized_size = measure_document(optimized_root, live_metadata, renderer_options)
+        saved = original_size - optimized_size
+        print(f"Tree optimization: {format_tree_stats(result['tree'])}")
+        print(
+            f"  {original_size:,} -> {optimized_size:,} bytes "
+            f"({saved:,} removed, {saved / original_size:.1%})"
+        )
+    if profiler is not None:
+        report = profiler.report(output_size)
+        args.profile.parent.mkdir(parents=True, exist_ok=True)
+        args.profile.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print_profile_report(report)
+        print(f"Profile: {args.profile}")
+    if args.shared_styles or args.minify:
+        # The comparison renders differ from the real build in one option
+        # only. measure_document keeps breakpoint CSS inline, so the real
+        # build is re-measured the same way when it split that CSS out.
+        comparison_root = load_compact_layout(INPUT_PATH, layout_cache_dir, args.optimize_tree)[0]
+        built_size = output_size
+        if renderer_options["split_media_css"]:
+            built_size = measure_document(comparison_root, live_metadata, renderer_options)
+    if args.shared_styles:
+        inline_size = measure_document(comparison_root, live_metadata, {**renderer_options, "shared_styles": False})
+        saved = inline_size - built_size
+        print(
+            f"Shared styles: {result['style_classes']:,} classes, "
+            f"{inline_size:,} -> {built_size:,} bytes "
+            f"({saved:,} saved, {saved / inline_size:.1%})"
+        )
+    if args.minify:
+        unminified_size = measure_document(comparison_root, live_metadata, {**renderer_options, "minify": False})
+        print(f"Minified: {unminified_size:,} -> {built_size:,} bytes")
 
 
 if __name__ == "__main__":
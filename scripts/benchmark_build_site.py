@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import build_site  # noqa: E402
+
+RESULTS_DIR = Path("build/benchmarks")
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+# Component mix of layout.builder (1).json: 1,359 boxes, 516 Text,
+# 77 Raw:Img and 63 Custom Code out of 2,015 nodes.
+COMPONENT_WEIGHTS = {
+    "box": 0.674,
+    "Text": 0.256,
+    "Raw:Img": 0.038,
+    "Custom Code": 0.032,
+}
+BOX_TAGS = ["span", "span", "span", "div", "div", "p", "a", "li", "button", "ul", "h2", "h3"]
+TEXT_TAGS = ["span", "span", "p", "h3", "li"]
+
+STYLE_PROPERTIES = {
+    "display": ["flex", "block", "inline-block", "grid", "none"],
+    "flexDirection": ["row", "column"],
+    "alignItems": ["center", "flex-start", "stretch"],
+    "justifyContent": ["center", "space-between", "flex-start"],
+    "position": ["relative", "absolute", "static"],
+    "width": ["100%", "50%", "320px", "auto", "43.54%"],
+    "maxWidth": ["1200px", "100%", "640px"],
+    "marginTop": ["0px", "8px", "16px", "24px"],
+    "paddingLeft": ["0px", "12px", "20px"],
+    "paddingRight": ["0px", "12px", "20px"],
+    "color": ["rgb(0, 0, 0)", "rgb(17, 24, 39)", "rgb(255, 255, 255)"],
+    "backgroundColor": ["rgba(0, 0, 0, 0)", "rgb(249, 248, 246)", "rgb(255, 255, 255)"],
+    "fontSize": ["14px", "16px", "18px", "24px"],
+    "fontWeight": ["400", "500", "700"],
+    "lineHeight": ["20px", "24px", "28px"],
+    "borderRadius": ["0px", "8px", "9999px"],
+    "outlineColor": ["rgb(0, 0, 0)"],
+    "textDecorationColor": ["rgb(0, 0, 0)"],
+    "transitionDuration": ["0.15s", "0.3s"],
+}
+BREAKPOINT_PROPERTIES = ["width", "fontSize", "paddingLeft", "display", "flexDirection"]
+CUSTOM_CODE_SNIPPET = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="none">'
+    '<path d="M12 2C6.48 2 2 6.48 2 12s4.48 10 10 10 10-4.48 10-10S17.52 2 12 2z'
+    'm0 18c-4.41 0-8-3.59-8-8s3.59-8 8-8 8 3.59 8 8-3.59 8-8 8z" fill="currentColor"/>'
+    "</svg>"
+) * 3
+
+
+def make_style_palette(
+    rng: random.Random,
+    palette_size: int,
+    breakpoint_density: float,
+) -> List[Dict[str, Dict[str, str]]]:
+    # Builder exports repeat a few hundred distinct style sets across the page.
+    palette: List[Dict[str, Dict[str, str]]] = []
+    names = list(STYLE_PROPERTIES)
+    for _ in range(palette_size):
+        chosen = rng.sample(names, rng.randint(3, 12))
+        styles: Dict[str, Dict[str, str]] = {
+            "large": {name: rng.choice(STYLE_PROPERTIES[name]) for name in chosen},
+        }
+        for bp in build_site.BREAKPOINT_QUERIES:
+            if rng.random() < breakpoint_density:
+                bp_names = rng.sample(BREAKPOINT_PROPERTIES, rng.randint(1, 3))
+                styles[bp] = {name: rng.choice(STYLE_PROPERTIES[name]) for name in bp_names}
+        palette.append(styles)
+    return palette
+
+
+def make_node(
+    rng: random.Random,
+    index: int,
+    component_name: str,
+    palette: List[Dict[str, Dict[str, str]]],
+) -> Dict[str, Any]:
+    node: Dict[str, Any] = {
+        "@type": "@builder.io/sdk:Element",
+        "id": f"builder-bench{index:08x}",
+        "responsiveStyles": rng.choice(palette),
+    }
+    if component_name == "Text":
+        node["tagName"] = rng.choice(TEXT_TAGS)
+        node["component"] = {
+            "name": "Text",
+            "options": {"text": f"Synthetic text block {index} for English Plumber"},
+        }
+    elif component_name == "Raw:Img":
+        node["component"] = {
+            "name": "Raw:Img",
+            "options": {"image": f"/mirror_media/synthetic-{index % 97}.webp"},
+        }
+        node["properties"] = {"alt": f"Image {index}", "loading": "lazy", "decoding": "async"}
+    elif component_name == "Custom Code":
+        node["tagName"] = "div"
+        node["component"] = {"name": "Custom Code", "options": {"code": CUSTOM_CODE_SNIPPET}}
+    else:
+        node["tagName"] = rng.choice(BOX_TAGS)
+        if rng.random() < 0.25:
+            node["properties"] = {"aria-hidden": "true"}
+    node["children"] = []
+    return node
+
+
+def generate_layout(
+    node_count: int,
+    max_depth: int = 16,
+    breakpoint_density: float = 0.05,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    palette = make_style_palette(rng, 400, breakpoint_density)
+    component_names = list(COMPONENT_WEIGHTS)
+    component_weights = list(COMPONENT_WEIGHTS.values())
+
+    title = {
+        "tagName": "title",
+        "children": [{"component": {"name": "Text", "options": {"text": "Benchmark Page"}}}],
+    }
+    head = {"tagName": "head", "children": [title]}
+    body = {"tagName": "div", "responsiveStyles": {"large": {"display": "flex"}}, "children": []}
+    root = {"tagName": "html", "properties": {"lang": "en"}, "children": [head, body]}
+
+    # (node, depth) pairs that may still receive children; recent containers
+    # are preferred so sections nest like a real page instead of a flat list.
+    containers: List[Tuple[Dict[str, Any], int]] = [(body, 1)]
+    for index in range(max(node_count - 5, 0)):
+        parent, depth = containers[-1 - min(int(rng.expovariate(0.3)), len(containers) - 1)]
+        component_name = rng.choices(component_names, component_weights)[0]
+        node = make_node(rng, index, component_name, palette)
+        parent["children"].append(node)
+        if component_name == "box" and depth + 1 < max_depth:
+            containers.append((node, depth + 1))
+            if len(containers) > 256:
+                del containers[: len(containers) - 256]
+    return root
+
+
+def measure_render(layout: Dict[str, Any], shared_styles: bool) -> Dict[str, Any]:
+    live_metadata = build_site.fallback_site_metadata()
+    started = time.perf_counter()
+    root = build_site.compact_tree(layout)
+    compact_seconds = time.perf_counter() - started
+
+    sink = build_site.ByteCounter()
+    started = time.perf_counter()
+    build_site.Renderer(live_metadata, shared_styles=shared_styles).write_document(root, sink)
+    seconds = time.perf_counter() - started
+
+    # tracemalloc slows rendering down, so memory is measured on a second pass.
+    tracemalloc.start()
+    build_site.Renderer(live_metadata, shared_styles=shared_styles).write_document(
+        root,
+        build_site.ByteCounter(),
+    )
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "compact_seconds": compact_seconds,
+        "seconds": seconds,
+        "output_bytes": sink.size,
+        "peak_memory_bytes": peak_bytes,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(path: Optional[Path]) -> Dict[int, Dict[str, Any]]:
+    if path is None:
+        return {}
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    return {result["nodes"]: result for result in payload.get("results", [])}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark build_site.Renderer on synthetic Builder layouts.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="node counts to generate, e.g. --sizes 1000 1000000 (default: 1k, 10k, 100k)",
+    )
+    parser.add_argument("--depth", type=int, default=16, help="maximum tree depth (default: 16)")
+    parser.add_argument(
+        "--breakpoint-density",
+        type=float,
+        default=0.05,
+        help="probability a style set carries rules for each breakpoint (default: 0.05)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="layout generator seed (default: 0)")
+    parser.add_argument("--shared-styles", action="store_true", help="benchmark the shared-styles output mode")
+    parser.add_argument("--output", type=Path, help=f"results JSON path (default: {RESULTS_DIR}/render-<timestamp>.json)")
+    parser.add_argument("--compare", type=Path, help="previous results JSON to print deltas against")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    previous = load_previous(args.compare)
+    started_at = datetime.now(timezone.utc)
+
+    results: List[Dict[str, Any]] = []
+    for size in args.sizes:
+        root = generate_layout(size, args.depth, args.breakpoint_density, args.seed)
+        nodes = build_site.count_nodes(root)
+        measured = measure_render(root, args.shared_styles)
+        result = {
+            "nodes": nodes,
+            "nodes_per_second": nodes / measured["seconds"] if measured["seconds"] else 0.0,
+            **measured,
+        }
+        results.append(result)
+
+        line = (
+            f"{nodes:>10,} nodes  {measured['seconds']:8.3f}s  "
+            f"{result['nodes_per_second']:>12,.0f} nodes/s  "
+            f"peak {measured['peak_memory_bytes'] / 1_048_576:8.1f} MiB  "
+            f"out {measured['output_bytes']:>14,} bytes"
+        )
+        baseline = previous.get(nodes)
+        if baseline and baseline.get("seconds"):
+            line += f"  ({measured['seconds'] / baseline['seconds'] - 1:+.1%} time vs baseline)"
+        print(line)
+
+    output_path = args.output or RESULTS_DIR / f"render-{started_at:%Y%m%d-%H%M%S}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "started_at": started_at.isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "depth": args.depth,
+            "breakpoint_density": args.breakpoint_density,
+            "seed": args.seed,
+            "shared_styles": args.shared_styles,
+        },
+        "results": results,
+    }
+    output_path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+    print(f"Results: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import zlib
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import build_site  # noqa: E402
+
+BUDGETS_PATH = Path("perf-budgets.json")
+HISTORY_PATH = Path("build/budget-history.json")
+READ_CHUNK_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+
+
+class PageScanner(HTMLParser):
+    # Streams a generated page once: element count, inline <style> and
+    # style="" bytes, and the image URLs an <img> would load by default.
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.dom_nodes = 0
+        self.inline_style_bytes = 0
+        self.style_attr_bytes = 0
+        self.image_urls: List[str] = []
+        self.in_style = False
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.dom_nodes += 1
+        for name, value in attrs:
+            if name == "style" and value:
+                self.style_attr_bytes += len(value.encode("utf-8"))
+        if tag == "style":
+            self.in_style = True
+        elif tag == "img":
+            values = dict(attrs)
+            url = values.get("src") or (values.get("srcset") or "").split(",")[0].strip().split(" ")[0]
+            if url:
+                self.image_urls.append(url)
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "style":
+            self.in_style = False
+
+    def handle_data(self, data: str) -> None:
+        if self.in_style:
+            self.inline_style_bytes += len(data.encode("utf-8"))
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def measure_page(path: Path) -> Dict[str, Any]:
+    scanner = PageScanner()
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    raw_bytes = 0
+    gzip_bytes = 0
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(READ_CHUNK_SIZE), b""):
+            raw_bytes += len(chunk)
+            gzip_bytes += len(compressor.compress(chunk))
+            scanner.feed(chunk.decode("utf-8", errors="replace"))
+    gzip_bytes += len(compressor.flush())
+    scanner.close()
+
+    # Each distinct image once, sized from the mirrored file it maps to;
+    # images still served from the live origin cannot be sized locally.
+    image_files: Set[Path] = set()
+    remote_images = 0
+    for url in dict.fromkeys(scanner.image_urls):
+        local_path = build_site.local_image_path(url)
+        if local_path is None:
+            remote_images += 1
+        else:
+            image_files.add(local_path.resolve())
+    return {
+        "html_bytes": raw_bytes,
+        "html_gzip_bytes": gzip_bytes,
+        "inline_style_bytes": scanner.inline_style_bytes,
+        "style_attr_bytes": scanner.style_attr_bytes,
+        "dom_nodes": scanner.dom_nodes,
+        "image_count": len(image_files),
+        "image_bytes": sum(file_size(image_path) for image_path in image_files),
+        "remote_images": remote_images,
+    }
+
+
+def load_json(path: Path) -> Dict[str, Any]:
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def measure_site() -> Dict[str, Any]:
+    asset_manifest = load_json(build_site.ASSET_MANIFEST_PATH)
+    stylesheets = [build_site.PUBLIC_DIR / path.lstrip("/") for path in asset_manifest.get("stylesheets") or []]
+    media_manifest = load_json(build_site.MEDIA_MANIFEST_PATH)
+    # Several source paths map to one stored file; count each file once.
+    media_files = {
+        build_site.PUBLIC_DIR / url.lstrip("/")
+        for url in (media_manifest.get("media") or {}).values()
+        if isinstance(url, str)
+    }
+    variant_files = {
+        build_site.PUBLIC_DIR / variant["url"].lstrip("/")
+        for entry in (media_manifest.get("images") or {}).values()
+        for variant in entry.get("variants", [])
+    }
+    return {
+        "stylesheet_count": len(stylesheets),
+        "stylesheet_bytes": sum(file_size(path) for path in stylesheets),
+        "media_files": len(media_files),
+        "media_bytes": sum(file_size(path) for path in media_files),
+        "variant_bytes": sum(file_size(path) for path in variant_files),
+    }
+
+
+def check_budgets(
+    measurements: Dict[str, Any],
+    budgets: Dict[str, Any],
+) -> List[Tuple[str, str, int, int]]:
+    # Returns (scope, metric, value, limit) for every budget that applies.
+    # Page budgets apply to each page, with per-page overrides under "pages".
+    checks: List[Tuple[str, str, int, int]] = []
+    for metric, limit in (budgets.get("site") or {}).items():
+        if metric in measurements["site"]:
+            checks.append(("site", metric, measurements["site"][metric], limit))
+    for page, page_measurements in measurements["pages"].items():
+        limits = {**(budgets.get("page") or {}), **((budgets.get("pages") or {}).get(page) or {})}
+        for metric, limit in limits.items():
+            if metric in page_measurements:
+                checks.append((page, metric, page_measurements[metric], limit))
+    return checks
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def git_dirty() -> bool:
+    try:
+        return bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+
+def load_history(path: Path) -> List[Dict[str, Any]]:
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    return payload if isinstance(payload, list) else []
+
+
+def append_history(path: Path, history: List[Dict[str, Any]], entry: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(history + [entry], indent=2) + "\n", encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def previous_value(previous: Optional[Dict[str, Any]], scope: str, metric: str) -> Optional[int]:
+    if previous is None:
+        return None
+    measurements = previous.get("measurements") or {}
+    values = measurements.get("site") if scope == "site" else (measurements.get("pages") or {}).get(scope)
+    return (values or {}).get(metric)
+
+
+def print_report(checks: List[Tuple[str, str, int, int]], previous: Optional[Dict[str, Any]]) -> None:
+    width = max((len(scope) for scope, *_ in checks), default=4)
+    for scope, metric, value, limit in checks:
+        status = "over" if value > limit else "ok"
+        line = f"{status:<5} {scope:<{width}}  {metric:<20} {value:>12,} / {limit:>12,} ({value / max(limit, 1):6.1%})"
+        before = previous_value(previous, scope, metric)
+        if before:
+            line += f"  {value - before:+,} since {previous.get('git_revision') or 'last run'}"  # type: ignore[union-attr]
+        print(line)
+
+
+def from_caller(path: Path, cwd: Path) -> Path:
+    # Paths given on the command line are relative to where the script was
+    # run; they are kept relative to ROOT when inside it so page names
+    # still match the "pages" overrides in the budgets file.
+    resolved = (cwd / path).resolve()
+    try:
+        return resolved.relative_to(ROOT)
+    except ValueError:
+        return resolved
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Check generated pages and assets against size budgets.")
+    parser.add_argument(
+        "pages",
+        nargs="*",
+        type=Path,
+        help=f"generated HTML pages to measure (default: budgets file \"check_pages\", else {build_site.OUTPUT_PATH})",
+    )
+    parser.add_argument("--budgets", type=Path, help=f"budgets JSON (default: {BUDGETS_PATH})")
+    parser.add_argument(
+        "--history",
+        type=Path,
+        help=f"JSON history each run is appended to (default: {HISTORY_PATH})",
+    )
+    parser.add_argument("--no-history", action="store_true", help="measure and check without recording the run")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cwd = Path.cwd()
+    args.pages = [from_caller(page, cwd) for page in args.pages]
+    args.budgets = from_caller(args.budgets, cwd) if args.budgets else BUDGETS_PATH
+    args.history = from_caller(args.history, cwd) if args.history else HISTORY_PATH
+    os.chdir(ROOT)
+    budgets = load_json(args.budgets)
+    if not budgets:
+        raise SystemExit(f"Missing or invalid budgets file: {args.budgets}")
+    pages = args.pages or [Path(page) for page in budgets.get("check_pages") or [build_site.OUTPUT_PATH]]
+    missing = [str(page) for page in pages if not page.is_file()]
+    if missing:
+        raise SystemExit(f"Missing generated pages: {', '.join(missing)}")
+
+    measurements = {
+        "site": measure_site(),
+        "pages": {page.as_posix(): measure_page(page) for page in pages},
+    }
+    checks = check_budgets(measurements, budgets)
+    failures = [check for check in checks if check[2] > check[3]]
+
+    history = load_history(args.history)
+    print_report(checks, history[-1] if history else None)
+    for page, values in measurements["pages"].items():
+        if values["remote_images"]:
+            print(f"note  {page}: {values['remote_images']} images load from the live origin and are not counted")
+
+    if not args.no_history:
+        entry = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "git_dirty": git_dirty(),
+            "python": platform.python_version(),
+            "measurements": measurements,
+            "failures": [
+                {"scope": scope, "metric": metric, "value": value, "limit": limit}
+                for scope, metric, value, limit in failures
+            ],
+        }
+        append_history(args.history, history, entry)
+        print(f"History: {args.history} ({len(history) + 1} runs)")
+
+    if failures:
+        print(f"{len(failures)} budget(s) exceeded")
+        raise SystemExit(1)
+    print(f"All {len(checks)} budgets met")
+
+
+if __name__ == "__main__":
+    main()
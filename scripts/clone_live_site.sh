@@ -67,9 +67,11 @@ while IFS= read -r -d '' file; do
   cp "$file" "$destination"
 done < <(find . -type f -print0)
 
-echo "[clone:live] syncing local media mirror..."
 cd "$ROOT_DIR"
-python3 "$ROOT_DIR/scripts/sync_media_assets.py"
+if [[ "${CLONE_SKIP_MEDIA_SYNC:-}" != "1" ]]; then
+  echo "[clone:live] syncing local media mirror..."
+  python3 "$ROOT_DIR/scripts/sync_media_assets.py"
+fi
 
 echo "[clone:live] done."
 echo "[clone:live] editable source: $SOURCE_HTML"
@@ -0,0 +1,443 @@
+from __future__ import annotations
+
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+# At-rules whose block holds further rules rather than declarations.
+GROUPING_AT_RULES = ("@media", "@supports", "@layer", "@container", "@document", "@scope")
+
+CSS_URL_PATTERN = re.compile(r"url\(\s*([\"']?)([^\"')]+)\1\s*\)")
+KEYFRAMES_NAME_PATTERN = re.compile(r"@(?:-[a-z]+-)?keyframes\s+([^\s{]+)", re.IGNORECASE)
+CSS_HEX_ESCAPE_PATTERN = re.compile(r"\\([0-9a-fA-F]{1,6})\s?")
+LICENSE_COMMENT_PATTERN = re.compile(r"/\*\s*!.*?\*/", re.DOTALL)
+
+
+def skip_string(text: str, index: int) -> int:
+    quote = text[index]
+    index += 1
+    while index < len(text):
+        ch = text[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch == quote:
+            return index + 1
+        index += 1
+    return index
+
+
+def strip_comments(css_text: str) -> str:
+    out: List[str] = []
+    index = 0
+    start = 0
+    while index < len(css_text):
+        ch = css_text[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch in "\"'":
+            index = skip_string(css_text, index)
+            continue
+        if css_text.startswith("/*", index):
+            out.append(css_text[start:index])
+            end = css_text.find("*/", index + 2)
+            index = len(css_text) if end == -1 else end + 2
+            start = index
+            continue
+        index += 1
+    out.append(css_text[start:])
+    return "".join(out)
+
+
+def find_block_end(text: str, index: int) -> int:
+    # `index` points just past an opening brace; returns the matching close.
+    depth = 1
+    while index < len(text):
+        ch = text[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch in "\"'":
+            index = skip_string(text, index)
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return index
+        index += 1
+    return len(text)
+
+
+def parse_css(css_text: str) -> List[Dict[str, Any]]:
+    # Style rules become {"kind": "style", "prelude", "body"}; grouping at-rules
+    # such as @media become {"kind": "group", "prelude", "rules"}; other block
+    # at-rules (@font-face, @keyframes, ...) become {"kind": "at", ...} and
+    # statements (@import, @charset, @layer a,b;) become {"kind": "statement"}.
+    return parse_rules(strip_comments(css_text))
+
+
+def parse_rules(text: str) -> List[Dict[str, Any]]:
+    rules: List[Dict[str, Any]] = []
+    index = 0
+    prelude_start = 0
+    paren_depth = 0
+    while index < len(text):
+        ch = text[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch in "\"'":
+            index = skip_string(text, index)
+            continue
+        if ch == "(":
+            paren_depth += 1
+        elif ch == ")":
+            paren_depth = max(paren_depth - 1, 0)
+        elif ch == ";" and paren_depth == 0:
+            statement = text[prelude_start:index].strip()
+            if statement:
+                rules.append({"kind": "statement", "prelude": statement})
+            prelude_start = index + 1
+        elif ch == "{" and paren_depth == 0:
+            prelude = text[prelude_start:index].strip()
+            end = find_block_end(text, index + 1)
+            body = text[index + 1:end]
+            lowered = prelude.lower()
+            if lowered.startswith(GROUPING_AT_RULES):
+                rules.append({"kind": "group", "prelude": prelude, "rules": parse_rules(body)})
+            elif prelude.startswith("@"):
+                rules.append({"kind": "at", "prelude": prelude, "body": body.strip()})
+            elif prelude:
+                rules.append({"kind": "style", "prelude": prelude, "body": body.strip()})
+            index = end + 1
+            prelude_start = index
+            continue
+        index += 1
+    return rules
+
+
+def serialize_rules(rules: List[Dict[str, Any]]) -> str:
+    chunks: List[str] = []
+    for rule in rules:
+        if rule["kind"] == "statement":
+            chunks.append(f"{rule['prelude']};")
+        elif rule["kind"] == "group":
+            chunks.append(f"{rule['prelude']}{{{serialize_rules(rule['rules'])}}}")
+        else:
+            chunks.append(f"{rule['prelude']}{{{rule['body']}}}")
+    return "".join(chunks)
+
+
+def split_selector_list(prelude: str) -> List[str]:
+    selectors: List[str] = []
+    depth = 0
+    start = 0
+    index = 0
+    while index < len(prelude):
+        ch = prelude[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch in "\"'":
+            index = skip_string(prelude, index)
+            continue
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth = max(depth - 1, 0)
+        elif ch == "," and depth == 0:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+        index += 1
+    selectors.append(prelude[start:].strip())
+    return [selector for selector in selectors if selector]
+
+
+def split_top_level(text: str, separator: str) -> List[str]:
+    # Splits on `separator` outside strings and parentheses, so url(data:...;...)
+    # values and quoted font names stay whole.
+    parts: List[str] = []
+    depth = 0
+    start = 0
+    index = 0
+    while index < len(text):
+        ch = text[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch in "\"'":
+            index = skip_string(text, index)
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(depth - 1, 0)
+        elif ch == separator and depth == 0:
+            parts.append(text[start:index].strip())
+            start = index + 1
+        index += 1
+    parts.append(text[start:].strip())
+    return [part for part in parts if part]
+
+
+def split_declarations(body: str) -> List[Tuple[str, str]]:
+    # (lowercased property, value) pairs of a declaration block. Custom
+    # properties keep their case since they are case-sensitive.
+    declarations: List[Tuple[str, str]] = []
+    for declaration in split_top_level(body, ";"):
+        name, colon, value = declaration.partition(":")
+        name = name.strip()
+        if colon and name:
+            declarations.append((name if name.startswith("--") else name.lower(), value.strip()))
+    return declarations
+
+
+def unescape_css_identifier(value: str) -> str:
+    value = CSS_HEX_ESCAPE_PATTERN.sub(lambda match: chr(int(match.group(1), 16)), value)
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def read_identifier(selector: str, index: int) -> Tuple[str, int]:
+    start = index
+    while index < len(selector):
+        ch = selector[index]
+        if ch == "\\":
+            hex_match = CSS_HEX_ESCAPE_PATTERN.match(selector, index)
+            index = hex_match.end() if hex_match else index + 2
+            continue
+        if ch.isalnum() or ch in "-_" or ord(ch) > 127:
+            index += 1
+            continue
+        break
+    return unescape_css_identifier(selector[start:index]), index
+
+
+def skip_bracketed(selector: str, index: int, opening: str, closing: str) -> int:
+    depth = 0
+    while index < len(selector):
+        ch = selector[index]
+        if ch == "\\":
+            index += 2
+            continue
+        if ch in "\"'":
+            index = skip_string(selector, index)
+            continue
+        if ch == opening:
+            depth += 1
+        elif ch == closing:
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        index += 1
+    return index
+
+
+def selector_requirements(selector: str) -> Tuple[Set[str], Set[str], Set[str]]:
+    # Classes, ids and type names a selector needs to exist in the document.
+    # Attribute selectors and the arguments of functional pseudo-classes such
+    # as :not()/:is()/:where() are ignored, which keeps the check conservative.
+    classes: Set[str] = set()
+    ids: Set[str] = set()
+    tags: Set[str] = set()
+    index = 0
+    compound_start = True
+    while index < len(selector):
+        ch = selector[index]
+        if ch == ".":
+            name, index = read_identifier(selector, index + 1)
+            if name:
+                classes.add(name)
+            compound_start = False
+            continue
+        if ch == "#":
+            name, index = read_identifier(selector, index + 1)
+            if name:
+                ids.add(name)
+            compound_start = False
+            continue
+        if ch == "[":
+            index = skip_bracketed(selector, index, "[", "]")
+            compound_start = False
+            continue
+        if ch == ":":
+            while index < len(selector) and selector[index] == ":":
+                index += 1
+            _, index = read_identifier(selector, index)
+            if index < len(selector) and selector[index] == "(":
+                index = skip_bracketed(selector, index, "(", ")")
+            compound_start = False
+            continue
+        if ch in " \t\n>+~":
+            compound_start = True
+            index += 1
+            continue
+        if compound_start and (ch.isalpha() or ch in "-_\\"):
+            name, index = read_identifier(selector, index)
+            if name:
+                tags.add(name.lower())
+            compound_start = False
+            continue
+        compound_start = False
+        index += 1
+    return classes, ids, tags
+
+
+def selector_may_match(selector: str, tokens: Dict[str, Set[str]]) -> bool:
+    classes, ids, tags = selector_requirements(selector)
+    return classes <= tokens["classes"] and ids <= tokens["ids"] and tags <= tokens["tags"]
+
+
+def filter_rules(rules: List[Dict[str, Any]], tokens: Dict[str, Set[str]]) -> List[Dict[str, Any]]:
+    # Keeps style rules (and only the selectors) that may match `tokens`.
+    # @font-face, statements and other non-style at-rules are kept; @keyframes
+    # only when their name is referenced by a kept rule.
+    kept = filter_style_rules(rules, tokens)
+    kept_text = serialize_rules([rule for rule in kept if not is_keyframes(rule)])
+    return drop_unused_keyframes(kept, kept_text)
+
+
+def filter_style_rules(rules: List[Dict[str, Any]], tokens: Dict[str, Set[str]]) -> List[Dict[str, Any]]:
+    kept: List[Dict[str, Any]] = []
+    for rule in rules:
+        if rule["kind"] == "style":
+            selectors = [
+                selector
+                for selector in split_selector_list(rule["prelude"])
+                if selector_may_match(selector, tokens)
+            ]
+            if selectors:
+                kept.append({**rule, "prelude": ",".join(selectors)})
+        elif rule["kind"] == "group":
+            nested = filter_style_rules(rule["rules"], tokens)
+            if nested:
+                kept.append({**rule, "rules": nested})
+        else:
+            kept.append(rule)
+    return kept
+
+
+def is_keyframes(rule: Dict[str, Any]) -> bool:
+    return rule["kind"] == "at" and KEYFRAMES_NAME_PATTERN.match(rule["prelude"]) is not None
+
+
+def drop_unused_keyframes(rules: List[Dict[str, Any]], used_text: str) -> List[Dict[str, Any]]:
+    kept: List[Dict[str, Any]] = []
+    for rule in rules:
+        if is_keyframes(rule):
+            match = KEYFRAMES_NAME_PATTERN.match(rule["prelude"])
+            if match and match.group(1) not in used_text:
+                continue
+        if rule["kind"] == "group":
+            rule = {**rule, "rules": drop_unused_keyframes(rule["rules"], used_text)}
+            if not rule["rules"]:
+                continue
+        kept.append(rule)
+    return kept
+
+
+def rebase_css_urls(css_text: str, base_url: str) -> str:
+    # Relative url() references are resolved against the stylesheet's own URL,
+    # so the CSS keeps working when inlined into or moved to another location.
+    def replace(match: re.Match[str]) -> str:
+        quote, target = match.group(1), match.group(2).strip()
+        lower = target.lower()
+        if lower.startswith(("data:", "http://", "https://", "//", "/", "#")):
+            return match.group(0)
+        return f"url({quote}{urljoin(base_url, target)}{quote})"
+
+    return CSS_URL_PATTERN.sub(replace, css_text)
+
+
+def collapse_whitespace(text: str, trim_around: str = "") -> str:
+    # Collapses whitespace runs outside strings to one space, dropping it
+    # entirely next to the characters in `trim_around`.
+    out: List[str] = []
+    index = 0
+    pending_space = False
+    while index < len(text):
+        ch = text[index]
+        if ch.isspace():
+            pending_space = True
+            index += 1
+            continue
+        if pending_space and out and out[-1][-1] not in trim_around and ch not in trim_around:
+            out.append(" ")
+        pending_space = False
+        if ch == "\\":
+            out.append(text[index:index + 2])
+            index += 2
+            continue
+        if ch in "\"'":
+            end = skip_string(text, index)
+            out.append(text[index:end])
+            index = end
+            continue
+        out.append(ch)
+        index += 1
+    return "".join(out)
+
+
+def minify_declarations(body: str) -> str:
+    # `--x: ;` keeps its space: older engines reject an empty custom property.
+    return ";".join(
+        f"{name}:{collapse_whitespace(value, ',') or (' ' if name.startswith('--') else '')}"
+        for name, value in split_declarations(body)
+    )
+
+
+def minify_rules(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Whitespace-only minification of parsed rules; empty rules are dropped.
+    minified: List[Dict[str, Any]] = []
+    for rule in rules:
+        prelude = collapse_whitespace(rule["prelude"], ",>")
+        if rule["kind"] == "group":
+            nested = minify_rules(rule["rules"])
+            if nested:
+                minified.append({**rule, "prelude": prelude, "rules": nested})
+        elif rule["kind"] == "statement":
+            minified.append({**rule, "prelude": prelude})
+        else:
+            body = rule["body"]
+            body = collapse_whitespace(body, "{};:,") if "{" in body else minify_declarations(body)
+            if body or rule["kind"] == "at":
+                minified.append({**rule, "prelude": prelude, "body": body})
+    return minified
+
+
+class DocumentTokenCollector(HTMLParser):
+    # Collects the tag names, classes and ids used by a document, optionally
+    # stopping after the first `element_limit` elements inside <body>.
+    def __init__(self, element_limit: Optional[int] = None) -> None:
+        super().__init__(convert_charrefs=True)
+        self.element_limit = element_limit
+        self.body_elements = 0
+        self.in_body = False
+        self.tokens: Dict[str, Set[str]] = {"classes": set(), "ids": set(), "tags": set()}
+
+    @property
+    def done(self) -> bool:
+        return self.element_limit is not None and self.body_elements >= self.element_limit
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self.done:
+            return
+        if tag == "body":
+            self.in_body = True
+        elif self.in_body:
+            self.body_elements += 1
+
+        self.tokens["tags"].add(tag.lower())
+        for key, value in attrs:
+            if not value:
+                continue
+            if key == "class":
+                self.tokens["classes"].update(value.split())
+            elif key == "id":
+                self.tokens["ids"].add(value)
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self.handle_starttag(tag, attrs)
@@ -0,0 +1,588 @@
+from __future__ import annotations
+
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+USER_AGENT = "Mozilla/5.0"
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30.0
+MAX_REDIRECTS = 5
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+NOT_MODIFIED = 304
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+# Shared response cache and record/replay archive, configured through the
+# environment so every script (and the refresh pipeline's subprocesses)
+# picks up the same mode: HTTP_CACHE=off disables the cache, and
+# HTTP_ARCHIVE_MODE=record|replay captures into / serves from
+# HTTP_ARCHIVE_DIR without touching the network on replay.
+DEFAULT_CACHE_DIR = Path(".build-cache/http")
+DEFAULT_ARCHIVE_DIR = Path("build/http-archive")
+ARCHIVE_MODES = ("record", "replay")
+STORE_VERSION = 1
+CACHEABLE_STATUSES = {200}
+HEURISTIC_FRESHNESS_FRACTION = 0.1
+MAX_HEURISTIC_FRESHNESS_SECONDS = 24 * 60 * 60
+CACHE_CONTROL_PATTERN = re.compile(r"([\w-]+)\s*(?:=\s*(\"[^\"]*\"|[^,\s]*))?")
+
+ConnectionKey = Tuple[str, str, int]
+
+
+class FetchError(Exception):
+    def __init__(
+        self,
+        url: str,
+        message: str,
+        status: Optional[int] = None,
+        reason: Optional[str] = None,
+    ) -> None:
+        super().__init__(f"{url}: {message}")
+        self.url = url
+        self.status = status
+        # Short failure category for reports, e.g. "HTTP 404" or "TimeoutError".
+        self.reason = reason or (f"HTTP {status}" if status else message)
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    return {
+        name.lower(): argument.strip('"') if argument else None
+        for name, argument in CACHE_CONTROL_PATTERN.findall(value or "")
+    }
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed.timestamp() if parsed.tzinfo else None
+
+
+def build_headers(items: Iterable[Tuple[str, str]]) -> http.client.HTTPMessage:
+    headers = http.client.HTTPMessage()
+    for name, value in items:
+        headers[name] = value
+    return headers
+
+
+class StoredResponse:
+    def __init__(self, meta: Dict[str, Any], body_path: Path) -> None:
+        self.meta = meta
+        self.status: int = meta["status"]
+        self.headers = build_headers(meta["headers"])
+        self.body_path = body_path
+
+    def read_body(self) -> bytes:
+        return self.body_path.read_bytes()
+
+    def copy_to(self, sink: BinaryIO) -> int:
+        sink.seek(0)
+        sink.truncate()
+        with self.body_path.open("rb") as source:
+            shutil.copyfileobj(source, sink, DOWNLOAD_CHUNK_SIZE)
+        return sink.tell()
+
+
+class ResponseStore:
+    # One JSON metadata file plus one body file per URL, named by the URL's
+    # hash. Writes go through per-thread temp files and atomic renames, so
+    # concurrent workers and processes never see half-written entries.
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def entry_paths(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def temp_path(self, path: Path) -> Path:
+        return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def load(self, url: str) -> Optional[StoredResponse]:
+        meta_path, body_path = self.entry_paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != STORE_VERSION or meta.get("url") != url or not body_path.is_file():
+            return None
+        return StoredResponse(meta, body_path)
+
+    def save(
+        self,
+        url: str,
+        status: int,
+        headers: http.client.HTTPMessage,
+        body: bytes = b"",
+        body_file: Optional[Path] = None,
+        **extra: Any,
+    ) -> StoredResponse:
+        # The body is either in memory or already streamed to `body_file`,
+        # which is moved into place.
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta_path, body_path = self.entry_paths(url)
+        if body_file is not None:
+            body_file.replace(body_path)
+        else:
+            tmp_body = self.temp_path(body_path)
+            tmp_body.write_bytes(body)
+            tmp_body.replace(body_path)
+        meta = {"version": STORE_VERSION, "url": url, "status": status, "headers": list(headers.items()), **extra}
+        tmp_meta = self.temp_path(meta_path)
+        tmp_meta.write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+        tmp_meta.replace(meta_path)
+        return StoredResponse(meta, body_path)
+
+
+class HttpCache(ResponseStore):
+    # Private cache following RFC 7234: responses are reused while fresh
+    # (max-age, else Expires, else 10% of the time since Last-Modified),
+    # revalidated with their validators once stale, and served stale only
+    # when the network is unreachable and the response allows it.
+    def store(
+        self,
+        url: str,
+        headers: http.client.HTTPMessage,
+        body: bytes,
+        request_time: float,
+        response_time: float,
+    ) -> Optional[StoredResponse]:
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in directives or headers.get("Vary", "").strip() == "*":
+            return None
+        return self.save(url, 200, headers, body, request_time=request_time, response_time=response_time)
+
+    def refresh(
+        self,
+        url: str,
+        cached: StoredResponse,
+        headers: http.client.HTTPMessage,
+        response_time: float,
+    ) -> StoredResponse:
+        # A 304 carries updated metadata for the stored body (RFC 7234 4.3.4).
+        merged = build_headers(cached.headers.items())
+        for name, value in headers.items():
+            if name.lower() in ("content-length", "transfer-encoding", "connection"):
+                continue
+            del merged[name]
+            merged[name] = value
+        meta_path, body_path = self.entry_paths(url)
+        meta = {
+            **cached.meta,
+            "headers": list(merged.items()),
+            "request_time": response_time,
+            "response_time": response_time,
+        }
+        tmp_meta = self.temp_path(meta_path)
+        tmp_meta.write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+        tmp_meta.replace(meta_path)
+        return StoredResponse(meta, body_path)
+
+    def freshness_lifetime(self, cached: StoredResponse) -> float:
+        directives = parse_cache_control(cached.headers.get("Cache-Control"))
+        if "no-cache" in directives:
+            return 0.0
+        max_age = directives.get("max-age")
+        if max_age is not None:
+            return float(max_age) if max_age.isdigit() else 0.0
+        date = parse_http_date(cached.headers.get("Date")) or cached.meta["response_time"]
+        expires = cached.headers.get("Expires")
+        if expires is not None:
+            expires_at = parse_http_date(expires)
+            return max(expires_at - date, 0.0) if expires_at is not None else 0.0
+        last_modified = parse_http_date(cached.headers.get("Last-Modified"))
+        if last_modified is not None:
+            return min(max(date - last_modified, 0.0) * HEURISTIC_FRESHNESS_FRACTION, MAX_HEURISTIC_FRESHNESS_SECONDS)
+        return 0.0
+
+    def current_age(self, cached: StoredResponse, now: float) -> float:
+        # RFC 7234 4.2.3.
+        request_time = cached.meta["request_time"]
+        response_time = cached.meta["response_time"]
+        date = parse_http_date(cached.headers.get("Date")) or response_time
+        age_header = cached.headers.get("Age", "")
+        age_value = float(age_header) if age_header.strip().isdigit() else 0.0
+        corrected_initial_age = max(response_time - date, age_value + (response_time - request_time), 0.0)
+        return corrected_initial_age + (now - response_time)
+
+    def is_fresh(self, cached: StoredResponse) -> bool:
+        return self.freshness_lifetime(cached) > self.current_age(cached, time.time())
+
+    def allows_stale(self, cached: StoredResponse) -> bool:
+        directives = parse_cache_control(cached.headers.get("Cache-Control"))
+        return not ({"must-revalidate", "no-cache"} & directives.keys())
+
+
+def validator_headers(headers: http.client.HTTPMessage) -> Dict[str, str]:
+    validators: Dict[str, str] = {}
+    if headers.get("ETag"):
+        validators["If-None-Match"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        validators["If-Modified-Since"] = headers["Last-Modified"]
+    return validators
+
+
+def matches_validators(headers: http.client.HTTPMessage, conditional: Dict[str, str]) -> bool:
+    etag = headers.get("ETag")
+    if etag and conditional.get("If-None-Match") == etag:
+        return True
+    last_modified = headers.get("Last-Modified")
+    return bool(last_modified) and conditional.get("If-Modified-Since") == last_modified
+
+
+class TeeSink:
+    # Lets a streamed download land in the caller's sink and in the archive
+    # body at the same time; supports what request_once uses.
+    def __init__(self, *targets: BinaryIO) -> None:
+        self.targets = targets
+
+    def seek(self, offset: int) -> None:
+        for target in self.targets:
+            target.seek(offset)
+
+    def truncate(self) -> None:
+        for target in self.targets:
+            target.truncate()
+
+    def write(self, chunk: bytes) -> None:
+        for target in self.targets:
+            target.write(chunk)
+
+
+class HttpPool:
+    # Thread-safe keep-alive client. Idle connections are kept per
+    # (scheme, host, port) and handed to whichever worker asks next, so a
+    # batch of requests to one origin reuses a few sockets instead of paying
+    # a TCP + TLS handshake per URL.
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        backoff: float = BACKOFF_SECONDS,
+        cache: Optional[HttpCache] = None,
+        archive: Optional[ResponseStore] = None,
+        archive_mode: Optional[str] = None,
+    ) -> None:
+        if archive_mode not in (None, *ARCHIVE_MODES):
+            raise ValueError(f"unknown archive mode {archive_mode!r}")
+        self.workers = max(workers, 1)
+        self.retries = max(retries, 0)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.cache = cache
+        self.archive = archive if archive_mode else None
+        self.archive_mode = archive_mode if archive is not None else None
+        self.idle: Dict[ConnectionKey, List[http.client.HTTPConnection]] = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "connections": 0,
+            "reused": 0,
+            "retries": 0,
+            "bytes": 0,
+            "cache_hits": 0,
+            "revalidated": 0,
+            "stale": 0,
+            "replayed": 0,
+            "recorded": 0,
+        }
+
+    def __enter__(self) -> HttpPool:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[name] += amount
+
+    def acquire(self, key: ConnectionKey) -> Tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                self.stats["reused"] += 1
+                return idle.pop(), True
+            self.stats["connections"] += 1
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(host, port, timeout=self.timeout), False
+
+    def release(self, key: ConnectionKey, connection: http.client.HTTPConnection) -> None:
+        with self.lock:
+            self.idle.setdefault(key, []).append(connection)
+
+    def close(self) -> None:
+        with self.lock:
+            connections = [connection for idle in self.idle.values() for connection in idle]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
+
+    def request_once(
+        self,
+        url: str,
+        sink: Optional[BinaryIO] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        # With a `sink`, a successful body is streamed into it in chunks (from
+        # the start, so a retried download overwrites the partial one) and the
+        # returned body is empty.
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise FetchError(url, f"unsupported scheme {scheme!r}")
+        key = (scheme, parts.hostname or "", parts.port or (443 if scheme == "https" else 80))
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+
+        while True:
+            connection, reused = self.acquire(key)
+            try:
+                connection.request("GET", target, headers={"User-Agent": USER_AGENT, **(headers or {})})
+                response = connection.getresponse()
+                if sink is not None and 200 <= response.status < 300:
+                    sink.seek(0)
+                    sink.truncate()
+                    size = 0
+                    for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        sink.write(chunk)
+                        size += len(chunk)
+                    body = b""
+                else:
+                    body = response.read()
+                    size = len(body)
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                # The server closed an idle keep-alive socket; that is not a
+                # failed attempt, so retry straight away on a fresh one.
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            self.count("requests")
+            self.count("bytes", size)
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(key, connection)
+            return response.status, response.headers, body
+
+    def retry_delay(self, attempt: int, headers: Optional[http.client.HTTPMessage]) -> float:
+        # Exponential backoff with jitter; a numeric Retry-After wins if longer.
+        delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        retry_after = headers.get("Retry-After", "") if headers is not None else ""
+        if retry_after.strip().isdigit():
+            delay = max(delay, float(retry_after))
+        return min(delay, MAX_BACKOFF_SECONDS)
+
+    def request_with_retries(
+        self,
+        url: str,
+        sink: Optional[BinaryIO] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        for attempt in range(self.retries + 1):
+            response_headers: Optional[http.client.HTTPMessage] = None
+            try:
+                status, response_headers, body = self.request_once(url, sink, headers)
+            except (OSError, http.client.HTTPException) as error:
+                failure = FetchError(url, str(error) or type(error).__name__, reason=type(error).__name__)
+            else:
+                if status not in RETRY_STATUSES:
+                    return status, response_headers, body
+                failure = FetchError(url, f"HTTP {status}", status)
+            if attempt == self.retries:
+                raise failure
+            self.count("retries")
+            time.sleep(self.retry_delay(attempt, response_headers))
+        raise AssertionError("unreachable")
+
+    def fetch_network(
+        self,
+        url: str,
+        sink: Optional[BinaryIO] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        # Follows redirects; returns (status, headers, body) for a 2xx, or
+        # a 304 answering conditional `headers`, and raises otherwise.
+        current = url
+        for _ in range(MAX_REDIRECTS + 1):
+            status, response_headers, body = self.request_with_retries(current, sink, headers)
+            location = response_headers.get("Location")
+            if status in REDIRECT_STATUSES and location:
+                current = urljoin(current, location)
+                continue
+            if 200 <= status < 300 or (status == NOT_MODIFIED and headers):
+                return status, response_headers, body
+            raise FetchError(url, f"HTTP {status}", status)
+        raise FetchError(url, f"more than {MAX_REDIRECTS} redirects", reason="redirect loop")
+
+    def fetch_response(
+        self,
+        url: str,
+        sink: Optional[BinaryIO] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        # fetch_network behind the archive and the cache. Streamed downloads
+        # and requests with caller-supplied conditional headers bypass the
+        # cache: their callers keep their own validated copies.
+        if self.archive_mode == "replay":
+            return self.replay(url, sink, headers)
+        if self.archive_mode == "record":
+            return self.record(url, sink)
+        if self.cache is None or sink is not None or headers:
+            return self.fetch_network(url, sink, headers)
+
+        cached = self.cache.load(url)
+        if cached is not None and self.cache.is_fresh(cached):
+            self.count("cache_hits")
+            return cached.status, cached.headers, cached.read_body()
+        request_time = time.time()
+        try:
+            status, response_headers, body = self.fetch_network(
+                url,
+                headers=validator_headers(cached.headers) if cached else None,
+            )
+        except FetchError as error:
+            # Unreachable (not an HTTP error status): fall back to the stale
+            # copy where the response permits it.
+            if cached is not None and error.status is None and self.cache.allows_stale(cached):
+                self.count("stale")
+                return cached.status, cached.headers, cached.read_body()
+            raise
+        response_time = time.time()
+        if cached is not None and status == NOT_MODIFIED:
+            self.count("revalidated")
+            cached = self.cache.refresh(url, cached, response_headers, response_time)
+            return cached.status, cached.headers, cached.read_body()
+        if status in CACHEABLE_STATUSES:
+            self.cache.store(url, response_headers, body, request_time, response_time)
+        return status, response_headers, body
+
+    def record(self, url: str, sink: Optional[BinaryIO]) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        # Always fetches the full body (no conditional headers) so the
+        # archive can answer any later request. HTTP error statuses are
+        # archived too, so replay fails the same way.
+        assert self.archive is not None
+        _, body_path = self.archive.entry_paths(url)
+        try:
+            if sink is None:
+                status, response_headers, body = self.fetch_network(url)
+                self.archive.save(url, status, response_headers, body)
+            else:
+                self.archive.directory.mkdir(parents=True, exist_ok=True)
+                tmp_body = self.archive.temp_path(body_path)
+                try:
+                    with tmp_body.open("wb") as archive_sink:
+                        tee = TeeSink(sink, archive_sink)
+                        status, response_headers, body = self.fetch_network(url, tee)  # type: ignore[arg-type]
+                    self.archive.save(url, status, response_headers, body_file=tmp_body)
+                finally:
+                    tmp_body.unlink(missing_ok=True)
+        except FetchError as error:
+            if error.status is not None:
+                self.archive.save(url, error.status, build_headers([]), reason=error.reason)
+            raise
+        self.count("recorded")
+        return status, response_headers, body
+
+    def replay(
+        self,
+        url: str,
+        sink: Optional[BinaryIO],
+        headers: Optional[Dict[str, str]],
+    ) -> Tuple[int, http.client.HTTPMessage, bytes]:
+        assert self.archive is not None
+        stored = self.archive.load(url)
+        if stored is None:
+            raise FetchError(url, f"not in archive {self.archive.directory}", reason="not archived")
+        self.count("replayed")
+        if not 200 <= stored.status < 300:
+            raise FetchError(url, f"HTTP {stored.status}", stored.status, stored.meta.get("reason"))
+        if headers and matches_validators(stored.headers, headers):
+            return NOT_MODIFIED, stored.headers, b""
+        if sink is not None:
+            self.count("bytes", stored.copy_to(sink))
+            return stored.status, stored.headers, b""
+        body = stored.read_body()
+        self.count("bytes", len(body))
+        return stored.status, stored.headers, body
+
+    def fetch(self, url: str) -> bytes:
+        return self.fetch_response(url)[2]
+
+    def download(
+        self,
+        url: str,
+        sink: BinaryIO,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, http.client.HTTPMessage]:
+        # Streams the body into `sink` so memory stays flat for large files.
+        # With conditional `headers` the status may be 304 and `sink` empty.
+        status, response_headers, _ = self.fetch_response(url, sink, headers)
+        return status, response_headers
+
+    def fetch_text(self, url: str) -> str:
+        return self.fetch(url).decode("utf-8", errors="replace")
+
+    def fetch_all(self, urls: Iterable[str]) -> Dict[str, bytes]:
+        # Fetches each distinct URL once on the worker pool. The first failure
+        # is raised after the other requests have finished.
+        unique = list(dict.fromkeys(urls))
+        if not unique:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(unique))) as executor:
+            bodies = list(executor.map(self.fetch, unique))
+        return dict(zip(unique, bodies))
+
+    def format_stats(self) -> str:
+        stats = self.stats
+        summary = (
+            f"{stats['requests']} requests over {stats['connections']} connections "
+            f"({stats['reused']} reused, {stats['retries']} retries)"
+        )
+        if self.cache is not None:
+            summary += (
+                f"; cache {stats['cache_hits']} fresh, {stats['revalidated']} revalidated, {stats['stale']} stale"
+            )
+        if self.archive_mode == "record":
+            summary += f"; recorded {stats['recorded']} to {self.archive.directory}"  # type: ignore[union-attr]
+        elif self.archive_mode == "replay":
+            summary += f"; replayed {stats['replayed']} from {self.archive.directory}"  # type: ignore[union-attr]
+        return summary
+
+
+def pool_from_environment(**kwargs: Any) -> HttpPool:
+    # HttpPool with the cache and archive selected by the environment (see
+    # DEFAULT_CACHE_DIR above); keyword arguments go to HttpPool.
+    cache = None
+    if os.environ.get("HTTP_CACHE", "on").lower() not in ("0", "off", "false", "no"):
+        cache = HttpCache(Path(os.environ.get("HTTP_CACHE_DIR") or DEFAULT_CACHE_DIR))
+    archive_mode = os.environ.get("HTTP_ARCHIVE_MODE") or None
+    if archive_mode not in (None, *ARCHIVE_MODES):
+        raise SystemExit(f"HTTP_ARCHIVE_MODE must be one of {', '.join(ARCHIVE_MODES)}, not {archive_mode!r}")
+    archive = ResponseStore(Path(os.environ.get("HTTP_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR)) if archive_mode else None
+    return HttpPool(cache=cache, archive=archive, archive_mode=archive_mode, **kwargs)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import struct
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_APP1_MARKER = 0xE1
+EXIF_HEADER = b"Exif\x00\x00"
+EXIF_ORIENTATION_TAG = 0x0112
+# Orientations 5-8 rotate by 90 degrees: the stored frame is displayed
+# with its width and height swapped.
+EXIF_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+PROBE_VERSION = 2
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+SVG_HEAD_BYTES = 4096
+SVG_TAG_PATTERN = re.compile(rb"<svg\b[^>]*>", re.IGNORECASE | re.DOTALL)
+SVG_ATTR_PATTERN = re.compile(rb"\s(width|height|viewBox)\s*=\s*[\"']([^\"']*)[\"']", re.IGNORECASE)
+SVG_LENGTH_PATTERN = re.compile(rb"^\s*([0-9.]+)\s*(px)?\s*$")
+
+
+def probe_png(handle: BinaryIO) -> Optional[Tuple[int, int]]:
+    header = handle.read(24)
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def probe_gif(handle: BinaryIO) -> Optional[Tuple[int, int]]:
+    header = handle.read(10)
+    if len(header) < 10 or header[:6] not in (b"GIF87a", b"GIF89a"):
+        return None
+    return struct.unpack("<HH", header[6:10])
+
+
+def probe_webp(handle: BinaryIO) -> Optional[Tuple[int, int]]:
+    header = handle.read(30)
+    if len(header) < 30 or header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def exif_orientation(payload: bytes) -> int:
+    # Reads the Orientation tag from the first IFD of an APP1 EXIF payload;
+    # 1 (as stored) when it is missing or malformed.
+    if not payload.startswith(EXIF_HEADER):
+        return 1
+    tiff = payload[len(EXIF_HEADER):]
+    byte_order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if byte_order is None:
+        return 1
+    try:
+        ifd_offset = struct.unpack(f"{byte_order}I", tiff[4:8])[0]
+        entry_count = struct.unpack(f"{byte_order}H", tiff[ifd_offset:ifd_offset + 2])[0]
+        for index in range(entry_count):
+            start = ifd_offset + 2 + index * 12
+            tag, _, _ = struct.unpack(f"{byte_order}HHI", tiff[start:start + 8])
+            if tag == EXIF_ORIENTATION_TAG:
+                return struct.unpack(f"{byte_order}H", tiff[start + 8:start + 10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def probe_jpeg(handle: BinaryIO) -> Optional[Tuple[int, int]]:
+    if handle.read(2) != b"\xff\xd8":
+        return None
+    # Walk the marker segments up to the first start-of-frame, which carries
+    # the stored dimensions. EXIF is read on the way for its orientation, and
+    # other payloads (ICC profiles, thumbnails) are skipped.
+    orientation = 1
+    while True:
+        byte = handle.read(1)
+        while byte and byte != b"\xff":
+            byte = handle.read(1)
+        while byte == b"\xff":
+            byte = handle.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker == 0xD9:
+            return None
+        length_bytes = handle.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            frame = handle.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack(">HH", frame[1:5])
+            if orientation in EXIF_TRANSPOSED_ORIENTATIONS:
+                return height, width
+            return width, height
+        if marker == JPEG_APP1_MARKER and orientation == 1:
+            orientation = exif_orientation(handle.read(length - 2))
+            continue
+        handle.seek(length - 2, 1)
+
+
+def probe_svg(handle: BinaryIO) -> Optional[Tuple[int, int]]:
+    tag_match = SVG_TAG_PATTERN.search(handle.read(SVG_HEAD_BYTES))
+    if not tag_match:
+        return None
+    attrs = {name.lower(): value for name, value in SVG_ATTR_PATTERN.findall(tag_match.group(0))}
+    width_match = SVG_LENGTH_PATTERN.match(attrs.get(b"width", b""))
+    height_match = SVG_LENGTH_PATTERN.match(attrs.get(b"height", b""))
+    if width_match and height_match:
+        return round(float(width_match.group(1))), round(float(height_match.group(1)))
+
+    view_box = attrs.get(b"viewbox", b"").replace(b",", b" ").split()
+    if len(view_box) == 4:
+        try:
+            return round(float(view_box[2])), round(float(view_box[3]))
+        except ValueError:
+            return None
+    return None
+
+
+PROBES = {
+    ".png": probe_png,
+    ".gif": probe_gif,
+    ".webp": probe_webp,
+    ".jpg": probe_jpeg,
+    ".jpeg": probe_jpeg,
+    ".svg": probe_svg,
+}
+
+
+def probe_image_size(path: Path) -> Optional[Tuple[int, int]]:
+    # Reads only the file header. The extension picks the first probe to try;
+    # the rest are tried in turn because mirrored files are sometimes misnamed.
+    first = PROBES.get(path.suffix.lower())
+    ordered = [first] if first else []
+    ordered.extend(probe for probe in PROBES.values() if probe not in ordered)
+    try:
+        with path.open("rb") as handle:
+            for probe in ordered:
+                handle.seek(0)
+                try:
+                    size = probe(handle)
+                except (struct.error, ValueError):
+                    size = None
+                if size and size[0] > 0 and size[1] > 0:
+                    return size
+    except OSError:
+        return None
+    return None
+
+
+class ImageDimensionIndex:
+    # Persistent path -> (width, height) index keyed by file size and mtime,
+    # so unchanged files are never re-opened on rebuilds. Entries from an
+    # older PROBE_VERSION are probed again.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries = self.load()
+        self.dirty = False
+
+    def load(self) -> Dict[str, Dict[str, int]]:
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return payload if isinstance(payload, dict) else {}
+
+    def dimensions(self, image_path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = image_path.stat()
+        except OSError:
+            return None
+
+        key = str(image_path)
+        entry = self.entries.get(key)
+        if (
+            entry
+            and entry.get("size") == stat.st_size
+            and entry.get("mtime_ns") == stat.st_mtime_ns
+            and entry.get("version") == PROBE_VERSION
+        ):
+            if not entry.get("width"):
+                return None
+            return entry["width"], entry["height"]
+
+        size = probe_image_size(image_path)
+        self.entries[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "version": PROBE_VERSION,
+            "width": size[0] if size else 0,
+            "height": size[1] if size else 0,
+        }
+        self.dirty = True
+        return size
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        # Batch workers share the index, so each writes its own temp file and
+        # swaps it in atomically.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.entries, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        tmp_path.replace(self.path)
+        self.dirty = False
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from scripts.http_pool import DEFAULT_WORKERS  # noqa: E402
+
+LIVE_ORIGIN = "https://englishplumber.nl"
+STATE_PATH = Path(".build-cache/pipeline-state.json")
+STATE_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+STAGE_NAMES = ["clone", "assets", "media", "site", "budgets", "next"]
+DEFAULT_STAGES = ["assets", "media", "site", "budgets"]
+OUTPUT_TAIL_LINES = 40
+
+
+class Stage:
+    # One step of the refresh flow. `inputs` and `outputs` are files or
+    # directories; a stage is up to date when its command and inputs hash to
+    # what they were on its last successful run and its outputs are still
+    # exactly what that run left behind.
+    def __init__(
+        self,
+        name: str,
+        command: List[str],
+        inputs: Sequence[str],
+        outputs: Sequence[str],
+        deps: Sequence[str] = (),
+        env: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.name = name
+        self.command = command
+        self.inputs = [Path(path) for path in inputs]
+        self.outputs = [Path(path) for path in outputs]
+        self.deps = list(deps)
+        self.env = env or {}
+
+
+class StageResult:
+    def __init__(self, status: str, started: float = 0.0, finished: float = 0.0, output: str = "") -> None:
+        self.status = status
+        self.started = started
+        self.finished = finished
+        self.output = output
+
+    @property
+    def seconds(self) -> float:
+        return self.finished - self.started
+
+
+class ContentHasher:
+    # sha256 per file, remembered by (size, mtime_ns) across runs so only
+    # files that actually changed are read again. Shared by stage threads.
+    def __init__(self, entries: Dict[str, List[Any]]) -> None:
+        self.entries = entries
+        self.lock = threading.Lock()
+
+    def file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = path.as_posix()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with path.open("rb") as handle:
+            for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def digest(self, paths: Sequence[Path], salt: str = "") -> str:
+        # Hidden files are skipped: they are the temp/partial files the sync
+        # scripts write before an atomic rename.
+        digest = hashlib.sha256(salt.encode("utf-8"))
+        for path in paths:
+            if path.is_dir():
+                files = sorted(
+                    file
+                    for file in path.rglob("*")
+                    if file.is_file() and not any(part.startswith(".") for part in file.relative_to(path).parts)
+                )
+            else:
+                files = [path] if path.is_file() else []
+            if not files:
+                digest.update(f"{path.as_posix()}\0missing\n".encode("utf-8"))
+            for file in files:
+                digest.update(f"{file.as_posix()}\0{self.file_digest(file)}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+
+def load_state() -> Dict[str, Any]:
+    try:
+        state = json.loads(STATE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"version": STATE_VERSION, "stages": {}, "files": {}}
+    if state.get("version") != STATE_VERSION:
+        return {"version": STATE_VERSION, "stages": {}, "files": {}}
+    return state
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = STATE_PATH.with_suffix(f"{STATE_PATH.suffix}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(state, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    tmp_path.replace(STATE_PATH)
+
+
+def define_stages(args: argparse.Namespace) -> Dict[str, Stage]:
+    python = sys.executable
+    mirror_html = "src/mirror/live-index.html"
+    stages = [
+        Stage(
+            "clone",
+            ["bash", "scripts/clone_live_site.sh"],
+            # No local inputs: whether the live site changed is unknowable
+            # without fetching it, so this stage always runs when selected.
+            inputs=[],
+            outputs=[mirror_html, "public/mirror_next"],
+            # The media stage runs separately, in parallel with assets.
+            env={"CLONE_SKIP_MEDIA_SYNC": "1"},
+        ),
+        Stage(
+            "assets",
+            [python, "scripts/sync_assets.py", "--origin", args.origin],
+            inputs=[mirror_html, "scripts/sync_assets.py", "scripts/http_pool.py", "scripts/css_tools.py"],
+            outputs=["src/generated/asset-manifest.json", "public/assets/styles", "public/assets/fonts"],
+            deps=["clone"],
+        ),
+        Stage(
+            "media",
+            [python, "scripts/sync_media_assets.py", "--origin", args.origin],
+            inputs=[mirror_html, "scripts/sync_media_assets.py", "scripts/http_pool.py", "scripts/image_probe.py"],
+            outputs=["src/generated/media-manifest.json", "src/generated/media-index.json", "public/mirror_media"],
+            deps=["clone"],
+        ),
+        Stage(
+            "site",
+            [python, "build_site.py"],
+            inputs=[
+                "build_site.py",
+                "layout.builder (1).json",
+                mirror_html,
+                "src/generated/asset-manifest.json",
+                "src/generated/media-manifest.json",
+                "scripts/css_tools.py",
+                "scripts/http_pool.py",
+                "scripts/image_probe.py",
+            ],
+            outputs=["index.from-json.html"],
+            deps=["assets", "media"],
+        ),
+        Stage(
+            "budgets",
+            [python, "scripts/check_budgets.py"],
+            inputs=[
+                "perf-budgets.json",
+                "scripts/check_budgets.py",
+                "build_site.py",
+                "index.from-json.html",
+                "src/generated/asset-manifest.json",
+                "src/generated/media-manifest.json",
+                "public/assets/styles",
+                "public/mirror_media",
+            ],
+            # Nothing to keep in sync: a pass is recorded only when every
+            # budget is met, so a breach fails again until it is fixed.
+            outputs=[],
+            deps=["site"],
+        ),
+        Stage(
+            "next",
+            ["pnpm", "run", "build"],
+            inputs=["pages", "src", "content", "public", "package.json", "pnpm-lock.yaml", "next.config.mjs"],
+            # BUILD_ID is rewritten by every build, so it stands in for .next.
+            outputs=[".next/BUILD_ID"],
+            deps=["assets", "media"],
+        ),
+    ]
+    return {stage.name: stage for stage in stages}
+
+
+def run_stage(stage: Stage, hasher: ContentHasher, state: Dict[str, Any], force: bool, origin: float) -> StageResult:
+    started = time.perf_counter() - origin
+    inputs_digest = hasher.digest(stage.inputs, salt="\0".join(stage.command))
+    record = state["stages"].get(stage.name)
+    if (
+        not force
+        and stage.inputs
+        and record
+        and record.get("inputs") == inputs_digest
+        and record.get("outputs") == hasher.digest(stage.outputs)
+    ):
+        return StageResult("up to date", started, time.perf_counter() - origin)
+
+    completed = subprocess.run(
+        stage.command,
+        cwd=ROOT,
+        env={**os.environ, **stage.env},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return StageResult(f"failed ({completed.returncode})", started, time.perf_counter() - origin, completed.stdout)
+    # Recorded only after success, so a failed or interrupted stage reruns.
+    state["stages"][stage.name] = {"inputs": inputs_digest, "outputs": hasher.digest(stage.outputs)}
+    return StageResult("ran", started, time.perf_counter() - origin, completed.stdout)
+
+
+def run_pipeline(
+    stages: Dict[str, Stage],
+    selected: List[str],
+    hasher: ContentHasher,
+    state: Dict[str, Any],
+    force: bool,
+    jobs: int,
+) -> Dict[str, StageResult]:
+    # Starts every stage whose selected dependencies have finished, so
+    # independent stages (assets and media) overlap. Dependencies that were
+    # not selected are assumed current; a failure blocks its dependents only.
+    results: Dict[str, StageResult] = {}
+    pending = [name for name in stages if name in selected]
+    running: Dict[Future[StageResult], str] = {}
+    origin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        while pending or running:
+            for name in list(pending):
+                deps = [dep for dep in stages[name].deps if dep in selected]
+                if any(dep not in results for dep in deps):
+                    continue
+                pending.remove(name)
+                if any(results[dep].status not in ("ran", "up to date") for dep in deps):
+                    now = time.perf_counter() - origin
+                    results[name] = StageResult("blocked", now, now)
+                    continue
+                print(f"[{name}] started: {' '.join(stages[name].command)}", flush=True)
+                running[executor.submit(run_stage, stages[name], hasher, state, force, origin)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                print_stage_output(name, results[name])
+    return results
+
+
+def print_stage_output(name: str, result: StageResult) -> None:
+    lines = result.output.rstrip().splitlines()
+    if len(lines) > OUTPUT_TAIL_LINES:
+        print(f"[{name}] ... {len(lines) - OUTPUT_TAIL_LINES} earlier lines omitted")
+    for line in lines[-OUTPUT_TAIL_LINES:]:
+        print(f"[{name}] {line}")
+    print(f"[{name}] {result.status} in {result.seconds:.2f}s", flush=True)
+
+
+def critical_path(stages: Dict[str, Stage], results: Dict[str, StageResult]) -> Tuple[List[str], float]:
+    # Walks back from the stage that finished last through whichever of its
+    # dependencies finished last: the chain that bounded the wall-clock time.
+    executed = {name: result for name, result in results.items() if result.status != "blocked"}
+    if not executed:
+        return [], 0.0
+    current: Optional[str] = max(executed, key=lambda name: executed[name].finished)
+    path: List[str] = []
+    while current is not None:
+        path.append(current)
+        deps = [dep for dep in stages[current].deps if dep in executed]
+        current = max(deps, key=lambda dep: executed[dep].finished) if deps else None
+    path.reverse()
+    return path, executed[path[-1]].finished
+
+
+def print_report(stages: Dict[str, Stage], results: Dict[str, StageResult], wall_seconds: float) -> None:
+    print()
+    print(f"{'stage':<10} {'status':<12} {'start':>8} {'seconds':>8}")
+    for name, result in sorted(results.items(), key=lambda item: item[1].started):
+        print(f"{name:<10} {result.status:<12} {result.started:>8.2f} {result.seconds:>8.2f}")
+    path, path_seconds = critical_path(stages, results)
+    serial_seconds = sum(result.seconds for result in results.values())
+    print(
+        f"Critical path: {' -> '.join(path)} ({path_seconds:.2f}s); "
+        f"wall {wall_seconds:.2f}s vs {serial_seconds:.2f}s run serially"
+    )
+
+
+def parse_args(stage_names: Sequence[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run the refresh flow as a dependency graph, skipping stages whose inputs are unchanged."
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=stage_names,
+        help=f"stages to run (default: {' '.join(DEFAULT_STAGES)}); unselected dependencies are assumed current",
+    )
+    parser.add_argument("--clone", action="store_true", help="re-clone the live site first (clone:live)")
+    parser.add_argument("--next-build", action="store_true", help="finish with the Next.js production build")
+    parser.add_argument(
+        "--origin",
+        default=LIVE_ORIGIN,
+        help=f"server the sync stages download from (default: {LIVE_ORIGIN})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run every selected stage even if up to date, e.g. to pick up upstream changes",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"stages run at once (default: {DEFAULT_WORKERS})",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args(STAGE_NAMES)
+    stages = define_stages(args)
+    selected: Set[str] = set(args.stages or DEFAULT_STAGES)
+    if args.clone:
+        selected.add("clone")
+    if args.next_build:
+        selected.add("next")
+
+    os.chdir(ROOT)
+    state = load_state()
+    hasher = ContentHasher(state["files"])
+    started = time.perf_counter()
+    try:
+        results = run_pipeline(stages, sorted(selected), hasher, state, args.force, args.jobs)
+    finally:
+        save_state(state)
+    print_report(stages, results, time.perf_counter() - started)
+    if any(result.status not in ("ran", "up to date") for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
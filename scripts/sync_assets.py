@@ -1,17 +1,43 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
+import hashlib
+import html
 import json
 import re
+import sys
+import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Set, Tuple
 from urllib.parse import urljoin, urlparse
-from urllib.request import Request, urlopen
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from scripts.css_tools import (  # noqa: E402
+    LICENSE_COMMENT_PATTERN,
+    DocumentTokenCollector,
+    filter_rules,
+    filter_style_rules,
+    minify_rules,
+    parse_css,
+    serialize_rules,
+    split_declarations,
+    split_top_level,
+)
+from scripts.http_pool import DEFAULT_RETRIES, DEFAULT_WORKERS, HttpPool, pool_from_environment  # noqa: E402
 
 LIVE_SITE_URL = "https://englishplumber.nl/"
 OUT_STYLES = Path("public/assets/styles")
 OUT_FONTS = Path("public/assets/fonts")
 MANIFEST = Path("src/generated/asset-manifest.json")
+PUBLIC_DIR = Path("public")
+PURGE_SOURCE_HTML = Path("src/mirror/live-index.html")
+HEADERS_PATH = Path("public/_headers")
+HEADERS_BLOCK_START = "# css-bundle: generated by scripts/sync_assets.py --bundle-css"
+HEADERS_BLOCK_END = "# end css-bundle"
+IMMUTABLE_CACHE_CONTROL = "public,max-age=31536000,immutable"
 
 STYLESHEET_PATTERN = re.compile(
     r'<link[^>]+rel="stylesheet"[^>]+href="([^"]+)"',
@@ -19,18 +45,21 @@ STYLESHEET_PATTERN = re.compile(
 )
 CSS_URL_PATTERN = re.compile(r"url\(([^)]+)\)")
 HIDDEN_HTML_PATTERN = re.compile(r"html\{opacity:0\}")
+BUNDLE_FILE_PATTERN = re.compile(r"bundle\.[0-9a-f]+\.css")
+HEADERS_BLOCK_PATTERN = re.compile(
+    rf"\n*{re.escape(HEADERS_BLOCK_START)}\n.*?{re.escape(HEADERS_BLOCK_END)}\n?",
+    re.DOTALL,
+)
+FONT_FACE_PATTERN = re.compile(r"@font-face\s*\{([^{}]*)\}", re.IGNORECASE)
+WOFF2_FORMAT_PATTERN = re.compile(r"format\(\s*[\"']?woff2", re.IGNORECASE)
+STYLE_ATTR_PATTERN = re.compile(r"\sstyle=\"([^\"]*)\"", re.IGNORECASE)
+CSS_VAR_PATTERN = re.compile(r"var\(\s*(--[\w-]+)[^()]*\)")
+UNICODE_RANGE_PATTERN = re.compile(r"u\+([0-9a-f?]+)(?:-([0-9a-f]+))?", re.IGNORECASE)
 
-
-def fetch_text(url: str) -> str:
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(req, timeout=30) as response:
-        return response.read().decode("utf-8", errors="replace")
-
-
-def fetch_bytes(url: str) -> bytes:
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(req, timeout=30) as response:
-        return response.read()
+# Body elements treated as above the fold when picking fonts to preload.
+PRELOAD_ELEMENT_LIMIT = 300
+PRELOAD_FONT_LIMIT = 3
+FONT_WEIGHT_KEYWORDS = {"normal": 400, "bold": 700}
 
 
 def normalize_quoted_url(raw: str) -> str:
@@ -38,44 +67,237 @@ def normalize_quoted_url(raw: str) -> str:
     return value
 
 
-def relink_css_assets(css_text: str) -> tuple[str, int]:
-    downloaded_count = 0
+def local_font_url(raw: str, stylesheet_url: str) -> Optional[str]:
+    # Absolute URL of a url() reference that should become a local asset.
+    original = normalize_quoted_url(raw)
+    if not original:
+        return None
 
-    def replace_url(match: re.Match[str]) -> str:
-        nonlocal downloaded_count
-        raw = match.group(1)
-        original = normalize_quoted_url(raw)
+    lower = original.lower()
+    if lower.startswith("data:") or lower.startswith("http://") or lower.startswith("https://"):
+        return None
+    if original.startswith("#"):
+        return None
 
-        if not original:
-            return match.group(0)
+    abs_url = urljoin(stylesheet_url, original)
+    parsed = urlparse(abs_url)
+    if not Path(parsed.path).name:
+        return None
 
-        lower = original.lower()
-        if lower.startswith("data:") or lower.startswith("http://") or lower.startswith("https://"):
-            return match.group(0)
-        if original.startswith("#"):
-            return match.group(0)
+    # Keep only local media files as owned assets (fonts/videojs glyphs).
+    if "/_next/static/media/" not in parsed.path:
+        return None
+    return abs_url
 
-        abs_url = urljoin(LIVE_SITE_URL, original)
-        parsed = urlparse(abs_url)
-        filename = Path(parsed.path).name
-        if not filename:
-            return match.group(0)
 
-        # Keep only local media files as owned assets (fonts/videojs glyphs).
-        if "/_next/static/media/" not in parsed.path:
-            return match.group(0)
+def font_filename(font_url: str) -> str:
+    return Path(urlparse(font_url).path).name
+
+
+def collect_font_urls(css_by_url: Dict[str, str]) -> List[str]:
+    font_urls: List[str] = []
+    for stylesheet_url, css_text in css_by_url.items():
+        for match in CSS_URL_PATTERN.finditer(css_text):
+            font_url = local_font_url(match.group(1), stylesheet_url)
+            if font_url:
+                font_urls.append(font_url)
+    return unique_keep_order(font_urls)
+
+
+def download_fonts(pool: HttpPool, font_urls: List[str]) -> int:
+    # Fonts shared by several stylesheets (or already on disk) are fetched
+    # once; the rest download concurrently on the pool.
+    missing: Dict[str, str] = {}
+    for font_url in font_urls:
+        filename = font_filename(font_url)
+        if filename not in missing.values() and not (OUT_FONTS / filename).exists():
+            missing[font_url] = filename
+
+    bodies = pool.fetch_all(missing)
+    OUT_FONTS.mkdir(parents=True, exist_ok=True)
+    for font_url, body in bodies.items():
+        target = OUT_FONTS / missing[font_url]
+        tmp_path = target.with_name(f".{target.name}.tmp")
+        tmp_path.write_bytes(body)
+        tmp_path.replace(target)
+    return len(bodies)
 
-        OUT_FONTS.mkdir(parents=True, exist_ok=True)
-        target = OUT_FONTS / filename
-        if not target.exists():
-            target.write_bytes(fetch_bytes(abs_url))
-            downloaded_count += 1
 
-        rel = f"../fonts/{filename}"
+def relink_css_assets(css_text: str, stylesheet_url: str) -> str:
+    def replace_url(match: re.Match[str]) -> str:
+        font_url = local_font_url(match.group(1), stylesheet_url)
+        if font_url is None:
+            return match.group(0)
+        rel = f"../fonts/{font_filename(font_url)}"
         return f"url({rel})"
 
-    rewritten = CSS_URL_PATTERN.sub(replace_url, css_text)
-    return rewritten, downloaded_count
+    return CSS_URL_PATTERN.sub(replace_url, css_text)
+
+
+def is_woff2_source(entry: str) -> bool:
+    if "format(" in entry.lower():
+        return WOFF2_FORMAT_PATTERN.search(entry) is not None
+    match = CSS_URL_PATTERN.search(entry)
+    if not match:
+        return False
+    return urlparse(normalize_quoted_url(match.group(1))).path.lower().endswith(".woff2")
+
+
+def prune_font_src(src: str) -> str:
+    # Every browser that loads these pages supports woff2, so when a face has
+    # a woff2 source the legacy fallbacks are dropped before they are synced.
+    entries = split_top_level(src, ",")
+    if not any(is_woff2_source(entry) for entry in entries):
+        return src
+    return ",".join(entry for entry in entries if entry.lower().startswith("local(") or is_woff2_source(entry))
+
+
+def font_family_name(value: str) -> str:
+    return value.strip().strip("\"'").strip().lower()
+
+
+def parse_font_faces(css_text: str, stylesheet_url: str) -> List[Dict[str, Any]]:
+    faces: List[Dict[str, Any]] = []
+    for match in FONT_FACE_PATTERN.finditer(css_text):
+        declarations = dict(split_declarations(match.group(1)))
+        font_url = None
+        for entry in split_top_level(prune_font_src(declarations.get("src", "")), ","):
+            url_match = CSS_URL_PATTERN.search(entry)
+            if url_match:
+                font_url = local_font_url(url_match.group(1), stylesheet_url)
+                break
+        faces.append(
+            {
+                "family": font_family_name(declarations.get("font-family", "")),
+                "style": declarations.get("font-style", "normal").lower(),
+                "weight": declarations.get("font-weight", "normal").lower(),
+                "unicode_range": declarations.get("unicode-range", ""),
+                "url": font_url,
+            }
+        )
+    return faces
+
+
+def font_values(rules: List[Dict[str, Any]]) -> List[str]:
+    # font/font-family values set by `rules`, with var() references resolved
+    # through the custom properties the same rules define (Next.js fonts are
+    # applied as `font-family:var(--font-x)` with `--font-x` set on <html>).
+    custom: Dict[str, List[str]] = {}
+    values: List[str] = []
+
+    def visit(nested: List[Dict[str, Any]]) -> None:
+        for rule in nested:
+            if rule["kind"] == "group":
+                visit(rule["rules"])
+            elif rule["kind"] == "style":
+                for name, value in split_declarations(rule["body"]):
+                    if name.startswith("--"):
+                        custom.setdefault(name, []).append(value)
+                    elif name in ("font", "font-family"):
+                        values.append(value)
+
+    visit(rules)
+    for _ in range(4):
+        values = [
+            CSS_VAR_PATTERN.sub(lambda match: ",".join(custom.get(match.group(1), [])), value)
+            for value in values
+        ]
+    return values
+
+
+def value_families(value: str, families: Set[str]) -> List[str]:
+    # Declared face families in a font/font-family value, in fallback order.
+    found: List[str] = []
+    for item in split_top_level(value, ","):
+        name = font_family_name(item.replace('"', "").replace("'", ""))
+        for family in families:
+            if name == family or name.endswith(f" {family}"):
+                found.append(family)
+                break
+    return found
+
+
+def used_font_families(
+    css_rules: List[List[Dict[str, Any]]],
+    tokens: Dict[str, Set[str]],
+    families: Set[str],
+    extra_values: Optional[List[str]] = None,
+) -> List[List[str]]:
+    # Face-family lists of every font declaration that may apply to a
+    # document with `tokens`.
+    rules = [rule for stylesheet_rules in css_rules for rule in filter_style_rules(stylesheet_rules, tokens)]
+    values = font_values(rules) + (extra_values or [])
+    return [found for found in (value_families(value, families) for value in values) if found]
+
+
+def inline_font_values(html_text: str) -> List[str]:
+    values: List[str] = []
+    for style in STYLE_ATTR_PATTERN.findall(html_text):
+        values.extend(
+            value
+            for name, value in split_declarations(html.unescape(style))
+            if name in ("font", "font-family")
+        )
+    return values
+
+
+def prune_font_faces(css_text: str, used_families: Set[str]) -> Tuple[str, int]:
+    # Drops @font-face rules for families the page never uses and trims the
+    # src lists of the rest. Returns (css, dropped face count).
+    dropped = 0
+
+    def replace_face(match: re.Match[str]) -> str:
+        nonlocal dropped
+        declarations = split_declarations(match.group(1))
+        family = font_family_name(dict(declarations).get("font-family", ""))
+        if family and family not in used_families:
+            dropped += 1
+            return ""
+        body = ";".join(
+            f"{name}:{prune_font_src(value) if name == 'src' else value}" for name, value in declarations
+        )
+        return f"@font-face{{{body}}}"
+
+    return FONT_FACE_PATTERN.sub(replace_face, css_text), dropped
+
+
+def covers_basic_latin(unicode_range: str) -> bool:
+    if not unicode_range.strip():
+        return True
+    for start, end in UNICODE_RANGE_PATTERN.findall(unicode_range):
+        low = int(start.replace("?", "0"), 16)
+        high = int(end, 16) if end else int(start.replace("?", "f"), 16)
+        if low <= ord("a") <= high:
+            return True
+    return False
+
+
+def weight_distance(weight: str, target: int = 400) -> int:
+    numbers = [int(value) for value in re.findall(r"\d+", weight)]
+    if not numbers:
+        numbers = [FONT_WEIGHT_KEYWORDS.get(weight.strip(), 400)]
+    if len(numbers) == 2 and numbers[0] <= target <= numbers[1]:
+        return 0
+    return min(abs(number - target) for number in numbers)
+
+
+def select_preload_fonts(faces: List[Dict[str, Any]], critical_families: List[str]) -> List[str]:
+    # One file per family used above the fold: the upright, Latin-covering
+    # face closest to regular weight, which is what body copy renders with.
+    preload: List[str] = []
+    for family in critical_families:
+        candidates = [
+            face
+            for face in faces
+            if face["family"] == family
+            and face["url"]
+            and face["style"] == "normal"
+            and covers_basic_latin(face["unicode_range"])
+        ]
+        if candidates:
+            best = min(candidates, key=lambda face: weight_distance(face["weight"]))
+            preload.append(f"assets/fonts/{font_filename(best['url'])}")
+    return unique_keep_order(preload)[:PRELOAD_FONT_LIMIT]
 
 
 def normalize_css_for_static(css_text: str) -> str:
@@ -95,40 +317,209 @@ def unique_keep_order(values: List[str]) -> List[str]:
     return out
 
 
-def main() -> None:
+def bundle_stylesheets(stylesheets: List[str], html_text: str, safelist: List[str]) -> Tuple[str, int]:
+    # Concatenates the localized stylesheets in manifest order (so the cascade
+    # is unchanged), drops rules whose selectors cannot match `html_text`, and
+    # minifies the rest. Returns (css, source bytes).
+    collector = DocumentTokenCollector()
+    collector.feed(html_text)
+    tokens = collector.tokens
+    tokens["classes"].update(safelist)
+
+    notices: List[str] = []
+    imports: List[Dict[str, Any]] = []
+    rules: List[Dict[str, Any]] = []
+    source_bytes = 0
+    for stylesheet in stylesheets:
+        css_text = (PUBLIC_DIR / stylesheet).read_text(encoding="utf-8")
+        source_bytes += len(css_text.encode("utf-8"))
+        notices.extend(LICENSE_COMMENT_PATTERN.findall(css_text))
+        for rule in parse_css(css_text):
+            prelude = rule["prelude"].lower()
+            if rule["kind"] == "statement" and prelude.startswith("@charset"):
+                continue
+            # @import is only valid before other rules, so imports are hoisted.
+            if rule["kind"] == "statement" and prelude.startswith("@import"):
+                imports.append(rule)
+            else:
+                rules.append(rule)
+
+    purged = filter_rules(imports + rules, tokens)
+    return "".join(unique_keep_order(notices)) + serialize_rules(minify_rules(purged)), source_bytes
+
+
+def write_bundle(css_text: str) -> str:
+    # The content hash in the name lets the bundle be cached as immutable;
+    # bundles from earlier runs are removed.
+    digest = hashlib.sha1(css_text.encode("utf-8")).hexdigest()[:10]
+    target = OUT_STYLES / f"bundle.{digest}.css"
+    OUT_STYLES.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f".{target.name}.tmp")
+    tmp_path.write_text(css_text, encoding="utf-8")
+    tmp_path.replace(target)
+    for stale in OUT_STYLES.iterdir():
+        if stale != target and BUNDLE_FILE_PATTERN.fullmatch(stale.name):
+            stale.unlink()
+    return f"assets/styles/{target.name}"
+
+
+def write_bundle_headers(bundle_path: str) -> None:
+    # Replaces the generated block in public/_headers, leaving the rest alone.
+    block = f"{HEADERS_BLOCK_START}\n/{bundle_path}\n  Cache-Control: {IMMUTABLE_CACHE_CONTROL}\n{HEADERS_BLOCK_END}\n"
+    existing = HEADERS_PATH.read_text(encoding="utf-8") if HEADERS_PATH.exists() else ""
+    remaining = HEADERS_BLOCK_PATTERN.sub("\n", existing).rstrip("\n")
+    HEADERS_PATH.write_text(f"{remaining}\n\n{block}" if remaining else block, encoding="utf-8")
+
+
+def bundle_manifest_stylesheets(manifest: Dict[str, List[str]], safelist: List[str]) -> Dict[str, List[str]]:
+    # Re-bundling starts from the original sheets, not an earlier bundle.
+    sources = manifest.get("source_stylesheets") or manifest.get("stylesheets") or []
+    missing = [stylesheet for stylesheet in sources if not (PUBLIC_DIR / stylesheet).exists()]
+    if missing:
+        raise SystemExit(f"Cannot bundle, missing stylesheets: {', '.join(missing)}")
+
+    css_text, source_bytes = bundle_stylesheets(
+        sources,
+        PURGE_SOURCE_HTML.read_text(encoding="utf-8", errors="ignore"),
+        safelist,
+    )
+    bundle_path = write_bundle(css_text)
+    write_bundle_headers(bundle_path)
+    print(
+        f"Bundled {len(sources)} stylesheets into {bundle_path}: "
+        f"{source_bytes:,} -> {len(css_text.encode('utf-8')):,} bytes"
+    )
+    return {**manifest, "stylesheets": [bundle_path], "source_stylesheets": sources}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Localize the live site's stylesheets and fonts.")
+    parser.add_argument(
+        "--origin",
+        default=LIVE_SITE_URL,
+        help=f"site to mirror, e.g. a local http.server stand-in (default: {LIVE_SITE_URL})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"concurrent downloads (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"retries per URL with exponential backoff (default: {DEFAULT_RETRIES})",
+    )
+    parser.add_argument(
+        "--bundle-css",
+        action="store_true",
+        help=f"bundle, purge (against {PURGE_SOURCE_HTML}) and minify the stylesheets into one content-hashed file",
+    )
+    parser.add_argument(
+        "--skip-sync",
+        action="store_true",
+        help="with --bundle-css, re-bundle the stylesheets already in the manifest without fetching",
+    )
+    parser.add_argument(
+        "--safelist",
+        action="append",
+        default=[],
+        metavar="CLASS",
+        help="class kept by the purge although absent from the HTML, e.g. one added by scripts (repeatable)",
+    )
+    args = parser.parse_args()
+    if args.skip_sync and not args.bundle_css:
+        parser.error("--skip-sync requires --bundle-css")
+    return args
+
+
+def sync_stylesheets(args: argparse.Namespace) -> Dict[str, List[str]]:
     OUT_STYLES.mkdir(parents=True, exist_ok=True)
     OUT_FONTS.mkdir(parents=True, exist_ok=True)
     MANIFEST.parent.mkdir(parents=True, exist_ok=True)
 
-    homepage = fetch_text(LIVE_SITE_URL)
-    hrefs = STYLESHEET_PATTERN.findall(homepage)
-    stylesheet_urls = unique_keep_order([urljoin(LIVE_SITE_URL, href) for href in hrefs])
+    started = time.perf_counter()
+    with pool_from_environment(workers=args.workers, retries=args.retries) as pool:
+        homepage = pool.fetch_text(args.origin)
+        hrefs = STYLESHEET_PATTERN.findall(homepage)
+        stylesheet_urls = [
+            stylesheet_url
+            for stylesheet_url in unique_keep_order([urljoin(args.origin, href) for href in hrefs])
+            if Path(urlparse(stylesheet_url).path).name
+        ]
+
+        # Two phases: fetch every stylesheet, then every font they reference,
+        # before any CSS is rewritten.
+        css_by_url = {
+            stylesheet_url: body.decode("utf-8", errors="replace")
+            for stylesheet_url, body in pool.fetch_all(stylesheet_urls).items()
+        }
+
+        # Faces are pruned before fonts are collected, so unused families and
+        # legacy formats are never downloaded.
+        css_rules = [parse_css(css_text) for css_text in css_by_url.values()]
+        faces = [
+            face
+            for stylesheet_url, css_text in css_by_url.items()
+            for face in parse_font_faces(css_text, stylesheet_url)
+        ]
+        families = {face["family"] for face in faces if face["family"]}
+        page_collector = DocumentTokenCollector()
+        page_collector.feed(homepage)
+        used_families = {
+            family
+            for found in used_font_families(css_rules, page_collector.tokens, families, inline_font_values(homepage))
+            for family in found
+        }
+        dropped_faces = 0
+        for stylesheet_url, css_text in css_by_url.items():
+            css_by_url[stylesheet_url], dropped = prune_font_faces(css_text, used_families)
+            dropped_faces += dropped
+
+        fold_collector = DocumentTokenCollector(PRELOAD_ELEMENT_LIMIT)
+        fold_collector.feed(homepage)
+        critical_families = unique_keep_order(
+            [found[0] for found in used_font_families(css_rules, fold_collector.tokens, families)]
+        )
+        preload = select_preload_fonts(
+            [face for face in faces if face["family"] in used_families],
+            critical_families,
+        )
+
+        total_font_downloads = download_fonts(pool, collect_font_urls(css_by_url))
 
     local_stylesheets: List[str] = []
-    total_font_downloads = 0
-
-    for stylesheet_url in stylesheet_urls:
-        parsed = urlparse(stylesheet_url)
-        filename = Path(parsed.path).name
-        if not filename:
-            continue
-
-        css_text = fetch_text(stylesheet_url)
-        css_rewritten, downloads = relink_css_assets(css_text)
+    for stylesheet_url, css_text in css_by_url.items():
+        filename = Path(urlparse(stylesheet_url).path).name
+        css_rewritten = relink_css_assets(css_text, stylesheet_url)
         css_rewritten = normalize_css_for_static(css_rewritten)
-        total_font_downloads += downloads
 
         out_path = OUT_STYLES / filename
         out_path.write_text(css_rewritten, encoding="utf-8")
         local_stylesheets.append(f"assets/styles/{filename}")
 
-    manifest: Dict[str, List[str]] = {
+    print(f"Synced {len(local_stylesheets)} stylesheets")
+    print(f"Downloaded {total_font_downloads} font/media files")
+    print(f"Dropped {dropped_faces} unused @font-face rules; preloading {len(preload)} fonts")
+    print(f"Fetched {pool.format_stats()} in {time.perf_counter() - started:.2f}s")
+    return {
         "stylesheets": local_stylesheets,
+        "preload": preload,
     }
-    MANIFEST.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
 
-    print(f"Synced {len(local_stylesheets)} stylesheets")
-    print(f"Downloaded {total_font_downloads} font/media files")
+
+def main() -> None:
+    args = parse_args()
+    if args.skip_sync:
+        manifest: Dict[str, List[str]] = json.loads(MANIFEST.read_text(encoding="utf-8"))
+    else:
+        manifest = sync_stylesheets(args)
+    if args.bundle_css:
+        manifest = bundle_manifest_stylesheets(manifest, args.safelist)
+
+    MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    MANIFEST.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
     print(f"Manifest: {MANIFEST}")
 
 
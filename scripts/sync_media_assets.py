@@ -1,19 +1,62 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
 import hashlib
 import html
 import json
+import os
 import re
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Iterable, Optional, Set, Tuple
-from urllib.parse import parse_qs, quote, unquote, urlparse
-from urllib.request import Request, urlopen
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from scripts.http_pool import (  # noqa: E402
+    DEFAULT_RETRIES,
+    DEFAULT_WORKERS,
+    NOT_MODIFIED,
+    FetchError,
+    HttpPool,
+    pool_from_environment,
+)
+from scripts.image_probe import probe_image_size  # noqa: E402
 
 LIVE_ORIGIN = "https://englishplumber.nl"
 SOURCE_HTML = Path("src/mirror/live-index.html")
 OUT_MEDIA = Path("public/mirror_media")
 MANIFEST = Path("src/generated/media-manifest.json")
+MEDIA_INDEX = Path("src/generated/media-index.json")
+MEDIA_INDEX_VERSION = 1
+MEDIA_TIMEOUT_SECONDS = 60.0
+HASH_CHUNK_SIZE = 1024 * 1024
+GONE_STATUSES = {404, 410}
+
+# Responsive variants are written next to the originals and named after the
+# source file, which already carries its content hash, so an unchanged source
+# maps to the same variant names on every run.
+VARIANT_DIR = OUT_MEDIA / "variants"
+VARIANT_URL_PREFIX = "/mirror_media/variants/"
+DEFAULT_VARIANT_WIDTHS = [320, 640, 960, 1280, 1920]
+DEFAULT_VARIANT_FORMATS = ["webp", "avif"]
+VARIANT_SOURCE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+VARIANT_QUALITY = {"webp": 80, "avif": 55}
+VARIANT_MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+# Sources that link /mirror_media/<file> directly (e.g. fallback images)
+# rather than through the manifest; garbage collection keeps those files.
+MEDIA_REFERENCE_ROOTS = (Path("src/mirror"), Path("pages"))
+MEDIA_REFERENCE_SUFFIXES = {".js", ".mjs", ".ts", ".tsx", ".html", ".css", ".json"}
+MEDIA_REFERENCE_PATTERN = re.compile(r"/mirror_media/([A-Za-z0-9._-]+)")
 
 ALLOWED_PREFIXES = (
     "/api/media/file/",
@@ -23,8 +66,17 @@ ALLOWED_PREFIXES = (
     "/faq.webp",
 )
 
-NEXT_IMAGE_PATTERN = re.compile(r"(?:https?://[^/]+)?/_next/image\?[^\"'<>\\s]+")
-DIRECT_PATH_PATTERN = re.compile(r"/(?:api/media/file|banner|reviews|footer)/[^\"'<>\\s]+|/faq\.webp(?:\?[^\"'<>\\s]+)?")
+# One alternation so each page is scanned in a single pass. Every branch
+# starts at "/" so the engine can skip ahead between slashes, and a Next.js
+# image proxy URL is matched whole so the source path inside it is not
+# matched again on its own. The proxy host is irrelevant: only its `url`
+# parameter is used.
+MEDIA_CANDIDATE_PATTERN = re.compile(
+    r"/(?:_next/image\?[^\"'<>\s\\]+"
+    r"|(?:api/media/file|banner|reviews|footer)/[^\"'<>\s\\]+"
+    r"|faq\.webp(?:\?[^\"'<>\s\\]+)?)"
+)
+MAX_SITEMAP_DEPTH = 3
 
 CONTENT_TYPE_EXT = {
     "image/jpeg": ".jpg",
@@ -38,13 +90,6 @@ CONTENT_TYPE_EXT = {
 }
 
 
-def fetch_bytes(url: str) -> Tuple[bytes, str]:
-    req = Request(url, headers={"User-Agent": "Mozilla/5.0"})
-    with urlopen(req, timeout=60) as response:
-        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
-        return response.read(), content_type
-
-
 def js_unescape(value: str) -> str:
     return (
         value.replace("\\/", "/")
@@ -60,7 +105,9 @@ def sanitize_filename(value: str) -> str:
     return safe or "asset"
 
 
+@lru_cache(maxsize=None)
 def canonicalize_path(raw_value: str) -> Optional[str]:
+    # Memoized: pages built from the same templates repeat most candidates.
     candidate = html.unescape(js_unescape(raw_value.strip())).rstrip("\\")
     if not candidate:
         return None
@@ -88,12 +135,94 @@ def canonicalize_path(raw_value: str) -> Optional[str]:
 
 
 def iter_raw_candidates(source: str) -> Iterable[str]:
-    for match in DIRECT_PATH_PATTERN.finditer(source):
-        yield match.group(0)
-    for match in NEXT_IMAGE_PATTERN.finditer(source):
+    for match in MEDIA_CANDIDATE_PATTERN.finditer(source):
         yield match.group(0)
 
 
+def scan_media_paths(source: str) -> Set[str]:
+    paths: Set[str] = set()
+    for raw in set(iter_raw_candidates(source)):
+        canonical = canonicalize_path(raw)
+        if canonical:
+            paths.add(canonical)
+    return paths
+
+
+def origin_url(url: str, origin: str) -> str:
+    # Sitemaps list live URLs; fetch the same path from --origin instead.
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{origin.rstrip('/')}{parts.path or '/'}{query}"
+
+
+def parse_sitemap(text: str) -> Tuple[List[str], List[str]]:
+    # Returns (page URLs, nested sitemap URLs); namespaces are ignored.
+    root = ElementTree.fromstring(text)
+    locs = [
+        (element.text or "").strip()
+        for element in root.iter()
+        if element.tag.rsplit("}", 1)[-1] == "loc" and (element.text or "").strip()
+    ]
+    if root.tag.rsplit("}", 1)[-1] == "sitemapindex":
+        return [], locs
+    return locs, []
+
+
+def read_sitemap_pages(pool: HttpPool, sitemap: str, origin: str) -> List[str]:
+    # `sitemap` is a local file or a URL; sitemap indexes are followed a few
+    # levels deep. Returns page URLs in sitemap order without repeats.
+    pages: List[str] = []
+    seen: Set[str] = set()
+    pending = [(sitemap, 0)]
+    while pending:
+        location, depth = pending.pop(0)
+        if location in seen:
+            continue
+        seen.add(location)
+        if Path(location).is_file():
+            text = Path(location).read_text(encoding="utf-8")
+        else:
+            text = pool.fetch_text(origin_url(location, origin))
+        try:
+            page_urls, nested = parse_sitemap(text)
+        except ElementTree.ParseError as error:
+            raise SystemExit(f"Invalid sitemap {location}: {error}")
+        pages.extend(page_urls)
+        if depth < MAX_SITEMAP_DEPTH:
+            pending.extend((url, depth + 1) for url in nested)
+    return list(dict.fromkeys(pages))
+
+
+def scan_page(pool: HttpPool, page: str, origin: str) -> Set[str]:
+    # Local HTML files are read from disk; anything else is a sitemap URL.
+    if Path(page).is_file():
+        source = Path(page).read_text(encoding="utf-8", errors="ignore")
+    else:
+        source = pool.fetch_text(origin_url(page, origin))
+    return scan_media_paths(source)
+
+
+def discover_media(pool: HttpPool, pages: List[str], origin: str) -> Tuple[Dict[str, List[str]], Counter[str]]:
+    # Fetches and scans pages concurrently. Returns (page -> media paths for
+    # every page scanned, failure reasons). Page text is dropped once
+    # scanned, so memory does not grow with the number of pages.
+    page_media: Dict[str, List[str]] = {}
+    failures: Counter[str] = Counter()
+    with ThreadPoolExecutor(max_workers=min(pool.workers, max(len(pages), 1))) as executor:
+        futures = {executor.submit(scan_page, pool, page, origin): page for page in pages}
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                page_media[page] = sorted(future.result())
+            except FetchError as error:
+                print(f"Skipped page {page}: {error}")
+                failures[error.reason] += 1
+            except OSError as error:
+                print(f"Skipped page {page}: {error}")
+                failures[type(error).__name__] += 1
+    return dict(sorted(page_media.items())), failures
+
+
 def choose_extension(path_only: str, content_type: str) -> str:
     known_ext = {".jpg", ".jpeg", ".png", ".webp", ".svg", ".gif", ".mp4", ".json"}
     suffix = Path(path_only).suffix.lower()
@@ -106,10 +235,361 @@ def choose_extension(path_only: str, content_type: str) -> str:
     return ".bin"
 
 
-def build_fetch_url(path_only: str) -> str:
+def build_fetch_url(path_only: str, origin: str = LIVE_ORIGIN) -> str:
     # Keep path separators while encoding only non-safe characters.
     encoded_path = quote(unquote(path_only), safe="/:@!$&()*+,;=.-_~[]")
-    return f"{LIVE_ORIGIN}{encoded_path}"
+    return f"{origin.rstrip('/')}{encoded_path}"
+
+
+def media_filename(path_only: str, content_type: str, content_hash: str) -> str:
+    ext = choose_extension(path_only, content_type)
+    base_name_raw = unquote(Path(path_only).name) or "asset"
+    base_stem = Path(base_name_raw).stem if Path(base_name_raw).suffix else base_name_raw
+    safe_stem = sanitize_filename(base_stem)
+    return f"{safe_stem}-{content_hash[:10]}{ext}"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaStore:
+    # Content-addressed view of OUT_MEDIA: each distinct body is stored once,
+    # named by its hash, and shared by every source path serving it. The index
+    # keeps each path's ETag/Last-Modified so re-syncs can revalidate with
+    # conditional GETs instead of downloading again.
+    def __init__(self, index_path: Path, media_dir: Path, manifest_path: Path) -> None:
+        self.index_path = index_path
+        self.media_dir = media_dir
+        self.manifest_path = manifest_path
+        self.lock = threading.Lock()
+        self.paths = self.load()
+        self.by_hash: Dict[str, str] = {
+            entry["sha256"]: entry["file"]
+            for entry in self.paths.values()
+            if (media_dir / entry["file"]).is_file()
+        }
+        if not self.paths:
+            self.adopt_existing_files()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            payload = json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if payload.get("version") != MEDIA_INDEX_VERSION:
+            return {}
+        return payload.get("paths") or {}
+
+    def adopt_existing_files(self) -> None:
+        # Without an index, files already on disk still dedupe new downloads,
+        # so the first indexed sync keeps their names instead of renaming.
+        hashes: Dict[str, str] = {}
+        for path in sorted(self.media_dir.iterdir()):
+            if path.is_file() and not path.name.startswith("."):
+                hashes[path.name] = file_sha256(path)
+                self.by_hash.setdefault(hashes[path.name], path.name)
+
+        # Paths the previous manifest mapped to those files join the index
+        # (without validators), so a failed fetch keeps serving them and
+        # garbage collection only removes files that were really superseded.
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        for key, local_url in (manifest.get("media") or {}).items():
+            filename = str(local_url).removeprefix("/mirror_media/")
+            if filename not in hashes:
+                continue
+            self.paths.setdefault(
+                quote(unquote(key), safe="/:@!$&()*+,;=.-_~[]"),
+                {
+                    "file": filename,
+                    "sha256": hashes[filename],
+                    "size": (self.media_dir / filename).stat().st_size,
+                    "etag": None,
+                    "last_modified": None,
+                },
+            )
+
+    def conditional_headers(self, path_only: str) -> Dict[str, str]:
+        with self.lock:
+            entry = self.paths.get(path_only)
+        if not entry or not (self.media_dir / entry["file"]).is_file():
+            return {}
+        headers: Dict[str, str] = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def add(self, path_only: str, tmp_path: Path, content_type: str, headers: Any, size: int) -> bool:
+        # Moves a finished download into the store; returns True when the same
+        # bytes were already stored and the download was dropped.
+        content_hash = file_sha256(tmp_path)
+        with self.lock:
+            filename = self.by_hash.get(content_hash)
+            deduplicated = filename is not None and (self.media_dir / filename).is_file()
+            if not deduplicated:
+                filename = media_filename(path_only, content_type, content_hash)
+                tmp_path.replace(self.media_dir / filename)
+                self.by_hash[content_hash] = filename
+            self.paths[path_only] = {
+                "file": filename,
+                "sha256": content_hash,
+                "size": size,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+            }
+        return deduplicated
+
+    def forget(self, path_only: str) -> None:
+        with self.lock:
+            self.paths.pop(path_only, None)
+
+    def retain(self, paths: Set[str]) -> None:
+        self.paths = {path_only: entry for path_only, entry in self.paths.items() if path_only in paths}
+
+    def collect_garbage(self, keep: Set[str]) -> Tuple[int, int]:
+        # Deletes files no indexed path (or `keep`) references, including
+        # .part files left by interrupted runs. Returns (files, bytes).
+        referenced = {entry["file"] for entry in self.paths.values()} | keep
+        removed = 0
+        removed_bytes = 0
+        for path in self.media_dir.iterdir():
+            if path.is_file() and path.name not in referenced:
+                removed_bytes += path.stat().st_size
+                path.unlink()
+                removed += 1
+        return removed, removed_bytes
+
+    def save(self) -> None:
+        payload = {"version": MEDIA_INDEX_VERSION, "paths": dict(sorted(self.paths.items()))}
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(f"{self.index_path.suffix}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+        tmp_path.replace(self.index_path)
+
+
+def referenced_media_files() -> Set[str]:
+    names: Set[str] = set()
+    for root in MEDIA_REFERENCE_ROOTS:
+        if not root.exists():
+            continue
+        for path in root.rglob("*"):
+            if path.suffix in MEDIA_REFERENCE_SUFFIXES and path.is_file():
+                names.update(MEDIA_REFERENCE_PATTERN.findall(path.read_text(encoding="utf-8", errors="ignore")))
+    return names
+
+
+def sync_media_path(pool: HttpPool, store: MediaStore, path_only: str, origin: str) -> Tuple[str, int]:
+    # Revalidates or downloads one asset and returns (outcome, bytes
+    # transferred). The body streams into a temp file that is only moved into
+    # the store once complete, so memory stays flat for video and an
+    # interrupted run never leaves a truncated file under a final name.
+    digest = hashlib.sha1(path_only.encode("utf-8")).hexdigest()[:10]
+    tmp_path = OUT_MEDIA / f".{digest}.{os.getpid()}.part"
+    try:
+        with tmp_path.open("wb") as sink:
+            status, headers = pool.download(
+                build_fetch_url(path_only, origin),
+                sink,
+                store.conditional_headers(path_only),
+            )
+            size = sink.tell()
+        if status == NOT_MODIFIED:
+            return "unchanged", 0
+        content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+        deduplicated = store.add(path_only, tmp_path, content_type, headers, size)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return ("deduplicated" if deduplicated else "downloaded"), size
+
+
+def load_pillow() -> Any:
+    # Pillow is optional: without it the sync still mirrors the originals.
+    # AVIF is built into Pillow 11.2+; older versions get it from the
+    # pillow-avif-plugin package when that is installed.
+    from PIL import Image  # type: ignore
+
+    try:
+        import pillow_avif  # type: ignore  # noqa: F401
+    except ImportError:
+        pass
+    Image.init()
+    return Image
+
+
+def available_variant_formats(requested: List[str]) -> List[str]:
+    try:
+        image_module = load_pillow()
+    except ImportError:
+        return []
+    return [fmt for fmt in requested if fmt.upper() in image_module.SAVE]
+
+
+class AnimatedImageError(ValueError):
+    # Raised for animated sources: a resized variant would keep only the
+    # first frame, so they are served as the original file alone.
+    pass
+
+
+def render_variants(
+    source: str,
+    variant_dir: str,
+    widths: List[int],
+    formats: List[str],
+) -> Tuple[int, int, List[Dict[str, Any]]]:
+    # Runs in a worker process. Resizes once per width and encodes that frame
+    # in every format; files that already exist are reused. Returns the
+    # source's (width, height) and the variants that are worth serving.
+    image_module = load_pillow()
+    from PIL import ImageOps  # type: ignore
+
+    source_path = Path(source)
+    source_bytes = source_path.stat().st_size
+    source_format = source_path.suffix.lower().lstrip(".")
+    variants: List[Dict[str, Any]] = []
+    try:
+        opened = image_module.open(source_path)
+    except image_module.DecompressionBombError as error:
+        # Raised as ValueError so the caller logs it like any undecodable file.
+        raise ValueError(f"too large to decode safely ({error})") from None
+    with opened:
+        if getattr(opened, "is_animated", False):
+            raise AnimatedImageError("animated, keeping the original only")
+        image = ImageOps.exif_transpose(opened)
+        width, height = image.size
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        for target in sorted({w for w in widths if w < width} | {width}):
+            target_height = max(round(height * target / width), 1)
+            resized = image if target == width else image.resize((target, target_height), image_module.LANCZOS)
+            for fmt in formats:
+                if target == width and fmt == source_format:
+                    continue
+                path = Path(variant_dir) / f"{source_path.stem}-{target}w.{fmt}"
+                if not path.exists():
+                    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+                    resized.save(tmp_path, format=fmt.upper(), quality=VARIANT_QUALITY[fmt])
+                    tmp_path.replace(path)
+                size = path.stat().st_size
+                # A full-width re-encode only helps if it is smaller.
+                if target == width and size >= source_bytes:
+                    path.unlink()
+                    continue
+                variants.append(
+                    {
+                        "url": f"{VARIANT_URL_PREFIX}{path.name}",
+                        "type": VARIANT_MIME_TYPES[fmt],
+                        "width": target,
+                        "height": target_height,
+                        "bytes": size,
+                    }
+                )
+    return width, height, variants
+
+
+def load_previous_images() -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # Returns the (images, variant_settings) sections of the last manifest.
+    try:
+        payload = json.loads(MANIFEST.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}, {}
+    return payload.get("images") or {}, payload.get("variant_settings") or {}
+
+
+def variants_present(entry: Dict[str, Any]) -> bool:
+    return all(
+        (VARIANT_DIR / variant["url"].removeprefix(VARIANT_URL_PREFIX)).is_file()
+        for variant in entry.get("variants", [])
+    )
+
+
+def build_image_variants(
+    store: MediaStore,
+    widths: List[int],
+    formats: List[str],
+    workers: Optional[int],
+    prune: bool,
+) -> Tuple[Dict[str, Any], Dict[str, Any], Counter[str]]:
+    # Returns (images manifest section, settings, outcome counts). Sources
+    # whose hash matches the previous manifest reuse their entry untouched.
+    previous, previous_settings = load_previous_images()
+    outcomes: Counter[str] = Counter()
+    sources = {
+        f"/mirror_media/{entry['file']}": entry["sha256"]
+        for entry in store.paths.values()
+        if Path(entry["file"]).suffix.lower() in VARIANT_SOURCE_SUFFIXES
+    }
+    if not formats:
+        # No encoder here: keep what an earlier run produced for files that
+        # are still mirrored rather than dropping their variants.
+        images = {
+            url: entry
+            for url, entry in previous.items()
+            if url in sources and entry.get("sha256") == sources[url] and variants_present(entry)
+        }
+        return images, previous_settings, outcomes
+
+    settings = {"widths": widths, "formats": formats}
+    reusable = previous if previous_settings == settings else {}
+
+    images: Dict[str, Any] = {}
+    pending: Dict[str, str] = {}
+    for url, content_hash in sorted(sources.items()):
+        entry = reusable.get(url)
+        if entry and entry.get("sha256") == content_hash and variants_present(entry):
+            images[url] = entry
+            outcomes["unchanged"] += 1
+        else:
+            pending[url] = content_hash
+
+    VARIANT_DIR.mkdir(parents=True, exist_ok=True)
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    render_variants,
+                    str(OUT_MEDIA / url.rsplit("/", 1)[1]),
+                    str(VARIANT_DIR),
+                    widths,
+                    formats,
+                ): url
+                for url in pending
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    width, height, variants = future.result()
+                except (OSError, ValueError) as error:
+                    # Undecodable or misnamed files keep only their original.
+                    print(f"Skipped variants for {url}: {error}")
+                    outcomes["animated" if isinstance(error, AnimatedImageError) else "failed"] += 1
+                    size = probe_image_size(OUT_MEDIA / url.rsplit("/", 1)[1])
+                    if not size:
+                        continue
+                    width, height, variants = size[0], size[1], []
+                else:
+                    outcomes["generated"] += 1
+                images[url] = {"sha256": pending[url], "width": width, "height": height, "variants": variants}
+
+    if prune:
+        referenced = {
+            variant["url"].removeprefix(VARIANT_URL_PREFIX)
+            for entry in images.values()
+            for variant in entry["variants"]
+        }
+        for path in VARIANT_DIR.iterdir():
+            if path.is_file() and path.name not in referenced:
+                path.unlink()
+                outcomes["pruned"] += 1
+    return dict(sorted(images.items())), settings, outcomes
 
 
 def media_key_variants(path_only: str) -> Set[str]:
@@ -118,58 +598,190 @@ def media_key_variants(path_only: str) -> Set[str]:
     return {path_only, decoded, reencoded}
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Download the media referenced by the mirrored homepage.")
+    parser.add_argument(
+        "--origin",
+        default=LIVE_ORIGIN,
+        help=f"server to download from, e.g. a local http.server stand-in (default: {LIVE_ORIGIN})",
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--sitemap",
+        help="discover media on every page of a sitemap (local file or URL, e.g. public/sitemap.xml); "
+        "pages are fetched from --origin",
+    )
+    source.add_argument(
+        "--pages",
+        nargs="+",
+        type=Path,
+        help=f"local HTML files to scan for media (default: {SOURCE_HTML})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"concurrent downloads (default: {DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help=f"retries per file with exponential backoff (default: {DEFAULT_RETRIES})",
+    )
+    parser.add_argument(
+        "--keep-orphans",
+        action="store_true",
+        help=f"do not delete files in {OUT_MEDIA} that no synced path references",
+    )
+    parser.add_argument(
+        "--variant-widths",
+        type=int,
+        nargs="+",
+        default=DEFAULT_VARIANT_WIDTHS,
+        help="responsive image widths to generate, narrower than the source only "
+        f"(default: {' '.join(map(str, DEFAULT_VARIANT_WIDTHS))})",
+    )
+    parser.add_argument(
+        "--variant-formats",
+        nargs="+",
+        choices=DEFAULT_VARIANT_FORMATS,
+        default=DEFAULT_VARIANT_FORMATS,
+        help="variant encodings; AVIF is skipped when Pillow has no AVIF encoder (default: webp avif)",
+    )
+    parser.add_argument(
+        "--variant-workers",
+        type=int,
+        help="processes encoding image variants (default: one per CPU)",
+    )
+    parser.add_argument("--no-variants", action="store_true", help="skip responsive image variant generation")
+    return parser.parse_args()
+
+
 def main() -> None:
-    if not SOURCE_HTML.exists():
-        raise SystemExit(f"Missing source mirror HTML: {SOURCE_HTML}")
+    args = parse_args()
+    local_pages = [] if args.sitemap else (args.pages or [SOURCE_HTML])
+    missing = [str(page) for page in local_pages if not page.is_file()]
+    if missing:
+        raise SystemExit(f"Missing source HTML: {', '.join(missing)}")
 
     OUT_MEDIA.mkdir(parents=True, exist_ok=True)
     MANIFEST.parent.mkdir(parents=True, exist_ok=True)
 
-    source = SOURCE_HTML.read_text(encoding="utf-8", errors="ignore")
-    canonical_paths: Set[str] = set()
-
-    for raw in iter_raw_candidates(source):
-        canonical = canonicalize_path(raw)
-        if canonical:
-            canonical_paths.add(canonical)
+    store = MediaStore(MEDIA_INDEX, OUT_MEDIA, MANIFEST)
+    outcomes: Counter[str] = Counter()
+    failures: Counter[str] = Counter()
+    transferred_bytes = 0
+
+    with pool_from_environment(workers=args.workers, retries=args.retries, timeout=MEDIA_TIMEOUT_SECONDS) as pool:
+        discovery_started = time.perf_counter()
+        if args.sitemap:
+            pages = read_sitemap_pages(pool, args.sitemap, args.origin)
+        else:
+            pages = [page.as_posix() for page in local_pages]
+        page_media, page_failures = discover_media(pool, pages, args.origin)
+        discovery_seconds = time.perf_counter() - discovery_started
+        canonical_paths = {path_only for paths in page_media.values() for path_only in paths}
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=pool.workers) as executor:
+            futures = {
+                executor.submit(sync_media_path, pool, store, path_only, args.origin): path_only
+                for path_only in sorted(canonical_paths)
+            }
+            for future in as_completed(futures):
+                try:
+                    outcome, size = future.result()
+                except FetchError as error:
+                    failures[error.reason] += 1
+                    # Gone upstream: drop it. Otherwise keep serving the copy
+                    # from the last successful sync.
+                    if error.status in GONE_STATUSES:
+                        store.forget(futures[future])
+                    continue
+                except OSError as error:
+                    failures[type(error).__name__] += 1
+                    continue
+                outcomes[outcome] += 1
+                transferred_bytes += size
+        seconds = time.perf_counter() - started
+
+    # Media seen only on a page that failed to load is still in use, and a
+    # failed download keeps serving its last copy, so an incomplete sync
+    # keeps every indexed path and deletes nothing.
+    complete = not page_failures and not failures
+    if complete:
+        store.retain(canonical_paths)
+    if args.keep_orphans or not complete:
+        removed, removed_bytes = 0, 0
+    else:
+        removed, removed_bytes = store.collect_garbage(referenced_media_files())
+    store.save()
+
+    if args.no_variants:
+        images, variant_settings, variant_outcomes = {}, {}, Counter()
+        variant_formats: List[str] = []
+    else:
+        variant_formats = available_variant_formats(args.variant_formats)
+        images, variant_settings, variant_outcomes = build_image_variants(
+            store,
+            sorted(set(args.variant_widths)),
+            variant_formats,
+            args.variant_workers,
+            prune=not args.keep_orphans,
+        )
 
     manifest_map: Dict[str, str] = {}
-    downloaded = 0
-    skipped = 0
-
-    for path_only in sorted(canonical_paths):
-        fetch_url = build_fetch_url(path_only)
-        try:
-            data, content_type = fetch_bytes(fetch_url)
-        except Exception:
-            skipped += 1
-            continue
-
-        ext = choose_extension(path_only, content_type)
-        base_name_raw = unquote(Path(path_only).name) or "asset"
-        base_stem = Path(base_name_raw).stem if Path(base_name_raw).suffix else base_name_raw
-        safe_stem = sanitize_filename(base_stem)
-        digest = hashlib.sha1(path_only.encode("utf-8")).hexdigest()[:10]
-        filename = f"{safe_stem}-{digest}{ext}"
-
-        out_path = OUT_MEDIA / filename
-        out_path.write_bytes(data)
-        downloaded += 1
-
-        local_url = f"/mirror_media/{filename}"
+    for path_only in sorted(store.paths):
+        local_url = f"/mirror_media/{store.paths[path_only]['file']}"
         for key in media_key_variants(path_only):
             manifest_map[key] = local_url
 
     payload = {
         "origin": LIVE_ORIGIN,
         "count": len(manifest_map),
-        "media": manifest_map,
+        "media": dict(sorted(manifest_map.items())),
     }
+    payload["pages"] = page_media
+    if images:
+        # Source dimensions and variants per mirrored file, for srcset/sizes.
+        payload["variant_settings"] = variant_settings
+        payload["images"] = images
     MANIFEST.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
 
+    print(
+        f"Scanned pages: {len(page_media)} of {len(pages)} in {discovery_seconds:.2f}s "
+        f"({canonicalize_path.cache_info().currsize} distinct candidates)"
+    )
+    for reason, count in page_failures.most_common():
+        print(f"  {reason}: {count}")
+    if not complete:
+        print("Some pages or downloads failed; kept all previously synced media and skipped orphan removal")
     print(f"Parsed media paths: {len(canonical_paths)}")
-    print(f"Downloaded assets: {downloaded}")
-    print(f"Skipped assets: {skipped}")
+    print(
+        f"Downloaded assets: {outcomes['downloaded']} "
+        f"(unchanged {outcomes['unchanged']}, deduplicated {outcomes['deduplicated']})"
+    )
+    print(f"Skipped assets: {sum(failures.values())}")
+    for reason, count in failures.most_common():
+        print(f"  {reason}: {count}")
+    if seconds > 0:
+        completed = sum(outcomes.values())
+        print(
+            f"Throughput: {transferred_bytes / 1_048_576:.1f} MiB in {seconds:.2f}s "
+            f"({transferred_bytes / 1_048_576 / seconds:.2f} MiB/s, {completed / seconds:.1f} files/s)"
+        )
+    print(f"Connections: {pool.format_stats()}")
+    print(f"Removed orphaned files: {removed} ({removed_bytes / 1_048_576:.1f} MiB)")
+    if variant_formats:
+        print(
+            f"Image variants ({', '.join(variant_formats)}): generated {variant_outcomes['generated']}, "
+            f"unchanged {variant_outcomes['unchanged']}, animated {variant_outcomes['animated']}, "
+            f"failed {variant_outcomes['failed']}, pruned files {variant_outcomes['pruned']}"
+        )
+    elif not args.no_variants:
+        print("Image variants: skipped, Pillow is not installed (pip install Pillow)")
+    print(f"Index: {MEDIA_INDEX}")
     print(f"Manifest: {MANIFEST}")
 
 